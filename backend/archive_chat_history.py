@@ -0,0 +1,51 @@
+import os
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+from database import engine
+
+# Moves old chat messages to chat_messages_archive so long-running conversations stay
+# fast to open. The newest CHAT_KEEP_RECENT messages of every conversation (user and
+# workspace) stay in place however old they are; /ask only ever reads the latest few.
+CHAT_ARCHIVE_DAYS = int(os.getenv("CHAT_ARCHIVE_DAYS", 90))
+CHAT_KEEP_RECENT = int(os.getenv("CHAT_KEEP_RECENT", 200))
+BATCH_SIZE = 1000
+
+ARCHIVE_BATCH = text("""
+    WITH moved AS (
+        DELETE FROM chat_messages WHERE id IN (
+            SELECT id FROM (
+                SELECT id, timestamp, row_number() OVER (
+                    PARTITION BY user_id, workspace_id ORDER BY timestamp DESC, id DESC
+                ) AS recency
+                FROM chat_messages
+            ) ranked
+            WHERE recency > :keep AND timestamp < :cutoff
+            LIMIT :batch_size
+        )
+        RETURNING id, role, content, timestamp, user_id, workspace_id
+    )
+    INSERT INTO chat_messages_archive (id, role, content, timestamp, user_id, workspace_id)
+    SELECT id, role, content, timestamp, user_id, workspace_id FROM moved
+""")
+
+def archive():
+    cutoff = datetime.now(timezone.utc) - timedelta(days=CHAT_ARCHIVE_DAYS)
+    total = 0
+    try:
+        while True:
+            # One transaction per batch keeps locks short on a busy table
+            with engine.begin() as connection:
+                moved = connection.execute(
+                    ARCHIVE_BATCH,
+                    {"keep": CHAT_KEEP_RECENT, "cutoff": cutoff, "batch_size": BATCH_SIZE}
+                ).rowcount
+            if not moved:
+                break
+            total += moved
+            print(f"🔄 Archived {total} messages so far...")
+        print(f"✅ Archive complete: {total} messages older than {CHAT_ARCHIVE_DAYS} days moved")
+    except Exception as e:
+        print(f"❌ Error archiving chat history: {e}")
+
+if __name__ == "__main__":
+    archive()
@@ -0,0 +1,44 @@
+from sqlalchemy import select
+from database import SessionLocal
+import models
+from services import chunk_service, document_store, vector_store
+
+# Papers ingested before chunk-level retrieval only have a single text[:8000] embedding.
+# This script splits their documents' stored content into chunks so they become searchable
+# again. Run migrate_schema.py first so every paper has a document with stored text.
+BATCH_SIZE = 50
+
+def backfill():
+    db = SessionLocal()
+    try:
+        has_chunks = select(models.PaperChunk.document_id).distinct()
+        last_id = 0
+        total = 0
+        while True:
+            documents = (
+                db.query(models.Document)
+                .filter(models.Document.id > last_id, models.Document.id.not_in(has_chunks))
+                .order_by(models.Document.id)
+                .limit(BATCH_SIZE)
+                .all()
+            )
+            if not documents:
+                break
+            for document in documents:
+                chunks = chunk_service.chunk_text(document_store.get_text(db, document.id) or "")
+                embeddings = vector_store.generate_embeddings(chunks)
+                for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+                    db.add(models.PaperChunk(document_id=document.id, chunk_index=i, content=chunk, embedding=embedding))
+                total += 1
+            db.commit()
+            last_id = documents[-1].id
+            print(f"🔄 Chunked {total} documents so far...")
+        print(f"✅ Backfill complete: {total} documents chunked")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error backfilling chunks: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    backfill()
@@ -0,0 +1,380 @@
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+# Load test for the API. Boots uvicorn against BENCH_DATABASE_URL (a scratch Postgres
+# with pgvector) with Groq and arXiv replaced by local fake servers and the hashing
+# embedder, seeds a workspace, then drives a weighted mix of endpoints and writes
+# p50/p95/p99 latency and throughput per endpoint as JSON.
+#
+#   python bench_api.py                     run and write bench_results/api-<time>.json
+#   python bench_api.py compare OLD NEW     print latency/throughput changes between runs
+BENCH_DATABASE_URL = os.getenv("BENCH_DATABASE_URL")
+BENCH_DURATION = float(os.getenv("BENCH_DURATION", 60))
+BENCH_CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", 16))
+BENCH_SEED_PAPERS = int(os.getenv("BENCH_SEED_PAPERS", 20))
+# Relative weights of the traffic mix
+BENCH_MIX = os.getenv("BENCH_MIX", "ask=5,papers=3,compare=1,upload=1,arxiv=1")
+# Simulated upstream latency of the fake Groq and arXiv servers
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", 0.3))
+FAKE_ARXIV_LATENCY = float(os.getenv("FAKE_ARXIV_LATENCY", 0.2))
+# Share of fake Groq calls answered with 429, to exercise the client's retries
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", 0))
+# Fresh user per run, made an admin of the API under test so it can read /stats/*
+BENCH_EMAIL = f"bench-{int(time.time() * 1000)}@example.com"
+BENCH_OUTPUT_DIR = os.getenv("BENCH_OUTPUT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results"))
+
+WORDS = (
+    "transformer attention retrieval embedding graph neural network diffusion model dataset "
+    "benchmark training inference latency quantization contrastive reinforcement policy "
+    "gradient optimizer convolution segmentation language vision protein molecule"
+).split()
+
+QUESTIONS = [
+    "What is the main contribution of these papers?",
+    "Which datasets are used for evaluation?",
+    "How does attention scale with sequence length?",
+    "What are the limitations of the proposed method?",
+    "Compare the training cost of the approaches.",
+]
+
+# --- Fake upstreams ---
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible chat completions, as called by the groq SDK."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+        if random.random() < FAKE_LLM_ERROR_RATE:
+            self._rate_limited()
+            return
+        time.sleep(FAKE_LLM_LATENCY)
+        model = body.get("model", "fake")
+        if body.get("response_format", {}).get("type") == "json_object":
+            content = json.dumps({
+                "methodology": "A transformer trained with a contrastive objective.",
+                "findings": "Improves retrieval accuracy on standard benchmarks.",
+                "limitations": "Evaluated on English corpora only.",
+                "application_area": "Information retrieval",
+            })
+        else:
+            content = _paragraph(random.Random(len(json.dumps(body))), 120)
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("content-type", "text/event-stream")
+            self.end_headers()
+            for word in content.split(" "):
+                chunk = {"id": "bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                         "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            final = {"id": "bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+            return
+
+        payload = json.dumps({
+            "id": "bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }).encode()
+        self.send_response(200)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _rate_limited(self):
+        payload = json.dumps({"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}).encode()
+        self.send_response(429)
+        self.send_header("content-type", "application/json")
+        self.send_header("retry-after", "0.1")
+        self.send_header("content-length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+class FakeArxivHandler(BaseHTTPRequestHandler):
+    """Atom feed in the shape of export.arxiv.org/api/query."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        count = int(params.get("max_results", ["10"])[0])
+        rng = random.Random(params.get("search_query", [""])[0])
+        time.sleep(FAKE_ARXIV_LATENCY)
+        entries = "".join(
+            f"<entry><id>http://arxiv.org/abs/2401.{i:05d}</id>"
+            f"<title>{_paragraph(rng, 6)}</title><summary>{_paragraph(rng, 60)}</summary>"
+            f"<published>2024-01-01T00:00:00Z</published><author><name>Author {i}</name></author>"
+            f"<link title=\"pdf\" href=\"http://arxiv.org/pdf/2401.{i:05d}\"/></entry>"
+            for i in range(count)
+        )
+        payload = f'<feed xmlns="http://www.w3.org/2005/Atom">{entries}</feed>'.encode()
+        self.send_response(200)
+        self.send_header("content-type", "application/atom+xml")
+        self.send_header("content-length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def start_server(handler) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def make_pdf(lines: list) -> bytes:
+    """Single-page PDF with one text line per entry, enough for the extraction pipeline."""
+    def escape(line):
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({escape(line)}) '" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream",
+    ]
+    pdf = "%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{obj}\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    return pdf.encode("latin-1")
+
+def random_pdf(rng: random.Random) -> bytes:
+    # Unique content per upload, otherwise content-addressed dedup would skip all work
+    return make_pdf([_paragraph(rng, 12) for _ in range(60)])
+
+# --- API under test ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_api(groq_url: str, arxiv_url: str) -> tuple:
+    port = free_port()
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": BENCH_DATABASE_URL,
+        "GROQ_API_KEY": "bench",
+        "GROQ_BASE_URL": groq_url,
+        "ARXIV_API_URL": arxiv_url,
+        "EMBEDDING_BACKEND": env.get("EMBEDDING_BACKEND", "hash"),
+        "ADMIN_EMAILS": BENCH_EMAIL,
+    })
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("API process exited during startup")
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=2).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("API did not become ready within 120s")
+
+async def wait_for_jobs(client: httpx.AsyncClient, job_ids: list):
+    while job_ids:
+        res = await client.get("/research/jobs", params={"ids": job_ids})
+        res.raise_for_status()
+        job_ids = [job["job_id"] for job in res.json() if job["status"] not in ("succeeded", "failed")]
+        await asyncio.sleep(0.5)
+
+async def seed(client: httpx.AsyncClient, rng: random.Random) -> dict:
+    (await client.post("/auth/register", json={"email": BENCH_EMAIL, "password": "bench-password"})).raise_for_status()
+    res = await client.post("/auth/token", data={"username": BENCH_EMAIL, "password": "bench-password"})
+    res.raise_for_status()
+    client.headers["Authorization"] = f"Bearer {res.json()['access_token']}"
+
+    res = await client.post("/workspaces/", json={"name": "bench"})
+    res.raise_for_status()
+    workspace_id = res.json()["id"]
+
+    job_ids = []
+    for i in range(BENCH_SEED_PAPERS):
+        res = await client.post(
+            "/research/upload",
+            data={"workspace_id": str(workspace_id)},
+            files={"file": (f"seed-{i}.pdf", random_pdf(rng), "application/pdf")},
+        )
+        res.raise_for_status()
+        job_ids.append(res.json()["job_id"])
+    await wait_for_jobs(client, job_ids)
+
+    res = await client.get("/research/papers", params={"workspace_id": workspace_id, "limit": 200})
+    res.raise_for_status()
+    return {"workspace_id": workspace_id, "paper_ids": [paper["id"] for paper in res.json()]}
+
+def build_requests(state: dict, rng: random.Random) -> dict:
+    workspace_id = state["workspace_id"]
+    return {
+        "ask": lambda: ("POST", "/research/ask", {"json": {"message": rng.choice(QUESTIONS), "workspace_id": workspace_id}}),
+        "papers": lambda: ("GET", "/research/papers", {"params": {"workspace_id": workspace_id}}),
+        "compare": lambda: ("POST", "/research/compare", {"json": {"paper_ids": rng.sample(state["paper_ids"], min(3, len(state["paper_ids"])))}}),
+        "upload": lambda: ("POST", "/research/upload", {
+            "data": {"workspace_id": str(workspace_id)},
+            "files": {"file": ("bench.pdf", random_pdf(rng), "application/pdf")},
+        }),
+        "arxiv": lambda: ("GET", "/search/arxiv", {"params": {"query": rng.choice(WORDS), "max_results": 10}}),
+    }
+
+async def drive(client: httpx.AsyncClient, state: dict) -> dict:
+    mix = {name: float(weight) for name, weight in (part.split("=") for part in BENCH_MIX.split(","))}
+    samples = {name: [] for name in mix}
+    statuses = {name: {} for name in mix}
+    deadline = time.monotonic() + BENCH_DURATION
+
+    async def worker(seed_value: int):
+        rng = random.Random(seed_value)
+        requests = build_requests(state, rng)
+        names, weights = list(mix), list(mix.values())
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            method, path, kwargs = requests[name]()
+            start = time.perf_counter()
+            try:
+                status = (await client.request(method, path, **kwargs)).status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            samples[name].append(time.perf_counter() - start)
+            statuses[name][str(status)] = statuses[name].get(str(status), 0) + 1
+
+    await asyncio.gather(*(worker(i) for i in range(BENCH_CONCURRENCY)))
+    return {name: summarize(samples[name], statuses[name]) for name in mix}
+
+def percentile(sorted_values: list, p: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+def summarize(latencies: list, statuses: dict) -> dict:
+    if not latencies:
+        return {"requests": 0, "statuses": statuses}
+    values = sorted(latencies)
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    return {
+        "requests": len(values),
+        "throughput_rps": len(values) / BENCH_DURATION,
+        "error_rate": 1 - ok / len(values),
+        "statuses": statuses,
+        "latency_ms": {
+            "p50": percentile(values, 50) * 1000,
+            "p95": percentile(values, 95) * 1000,
+            "p99": percentile(values, 99) * 1000,
+            "max": values[-1] * 1000,
+        },
+    }
+
+def git_revision() -> str:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return result.stdout.strip() or "unknown"
+
+async def run_benchmark(base_url: str) -> dict:
+    rng = random.Random(0)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=httpx.Limits(max_connections=BENCH_CONCURRENCY * 2)) as client:
+        state = await seed(client, rng)
+        endpoints = await drive(client, state)
+        db_stats = (await client.get("/stats/db")).json()
+        cache_stats = (await client.get("/stats/cache")).json()
+    return {
+        "revision": git_revision(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "duration_seconds": BENCH_DURATION,
+            "concurrency": BENCH_CONCURRENCY,
+            "seed_papers": BENCH_SEED_PAPERS,
+            "mix": BENCH_MIX,
+            "fake_llm_latency": FAKE_LLM_LATENCY,
+            "fake_arxiv_latency": FAKE_ARXIV_LATENCY,
+            "fake_llm_error_rate": FAKE_LLM_ERROR_RATE,
+            "embedding_backend": os.getenv("EMBEDDING_BACKEND", "hash"),
+            "vector_index_backend": os.getenv("VECTOR_INDEX_BACKEND", "pgvector"),
+        },
+        "endpoints": endpoints,
+        "server": {"db": db_stats, "cache": cache_stats},
+    }
+
+def compare(old_path: str, new_path: str):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['revision']} -> {new['revision']}")
+    for name, after in new["endpoints"].items():
+        before = old["endpoints"].get(name)
+        if not before or not before.get("requests") or not after.get("requests"):
+            continue
+        changes = [
+            f"{p} {before['latency_ms'][p]:.0f} -> {after['latency_ms'][p]:.0f} ms ({after['latency_ms'][p] / before['latency_ms'][p] - 1:+.0%})"
+            for p in ("p50", "p95", "p99")
+        ]
+        rps = f"{before['throughput_rps']:.1f} -> {after['throughput_rps']:.1f} rps"
+        print(f"{name:8} {rps:24} " + ", ".join(changes))
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == "compare":
+        compare(sys.argv[2], sys.argv[3])
+        return
+    if not BENCH_DATABASE_URL:
+        print("❌ Set BENCH_DATABASE_URL to a scratch Postgres database with the vector extension")
+        sys.exit(1)
+
+    groq = start_server(FakeGroqHandler)
+    arxiv = start_server(FakeArxivHandler)
+    process, base_url = start_api(f"http://127.0.0.1:{groq.server_port}", f"http://127.0.0.1:{arxiv.server_port}/api/query")
+    try:
+        report = asyncio.run(run_benchmark(base_url))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        groq.shutdown()
+        arxiv.shutdown()
+
+    os.makedirs(BENCH_OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(BENCH_OUTPUT_DIR, f"api-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, stats in report["endpoints"].items():
+        if stats["requests"]:
+            latency = stats["latency_ms"]
+            print(f"{name:8} {stats['requests']:6} req {stats['throughput_rps']:7.1f} rps  "
+                  f"p50 {latency['p50']:7.1f}  p95 {latency['p95']:7.1f}  p99 {latency['p99']:7.1f} ms  "
+                  f"errors {stats['error_rate']:.1%}")
+    print(f"✅ Results written to {path}")
+
+if __name__ == "__main__":
+    main()
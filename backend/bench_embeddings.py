@@ -0,0 +1,94 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+# Compares the ONNX int8 backend against the torch reference: cosine agreement on a
+# sample corpus, encode throughput and peak RSS of a process running each backend.
+# Exits non-zero when agreement drops below the thresholds.
+MIN_MEAN_COSINE = float(os.getenv("EMBED_PARITY_MIN_MEAN", 0.99))
+MIN_COSINE = float(os.getenv("EMBED_PARITY_MIN", 0.97))
+ROUNDS = int(os.getenv("EMBED_BENCH_ROUNDS", 3))
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+SAMPLE_TEXTS = [
+    "We propose a transformer architecture for long-document summarization.",
+    "Retrieval-augmented generation grounds language model answers in external documents.",
+    "The dataset contains 1.2 million annotated chest X-ray images.",
+    "Our method outperforms BERT-base on GLUE while using 40% fewer parameters.",
+    "Limitations include the reliance on English-only corpora and high inference cost.",
+    "Graph neural networks aggregate information from neighbouring nodes.",
+    "We evaluate on ImageNet-1k, CIFAR-10 and CIFAR-100.",
+    "Reinforcement learning from human feedback aligns model outputs with preferences.",
+    "Contrastive pretraining learns joint image-text representations.",
+    "The proposed sampler reduces the variance of the gradient estimator.",
+    "what is the main contribution of this paper?",
+    "LoRA",
+]
+
+WORKER = r"""
+import json, resource, sys, time
+import numpy as np
+from services import embedding_backends
+
+name, model_name, texts_path, out_path, rounds = sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5])
+texts = json.load(open(texts_path))
+backend = embedding_backends.create_backend(name, model_name)
+backend.encode(texts[:4]) # warm up
+start = time.perf_counter()
+for _ in range(rounds):
+    vectors = backend.encode(texts)
+elapsed = time.perf_counter() - start
+np.save(out_path, vectors)
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"texts_per_second": len(texts) * rounds / elapsed, "peak_rss_mb": peak_kb / 1024}))
+"""
+
+def build_corpus() -> list:
+    # Mix short queries with chunk-sized passages so both regimes are measured
+    passages = [" ".join(SAMPLE_TEXTS[i:] + SAMPLE_TEXTS[:i]) for i in range(len(SAMPLE_TEXTS))]
+    return (SAMPLE_TEXTS + passages) * 4
+
+def run_backend(name: str, texts_path: str, workdir: str):
+    out_path = os.path.join(workdir, f"{name}.npy")
+    result = subprocess.run(
+        [sys.executable, "-c", WORKER, name, MODEL_NAME, texts_path, out_path, str(ROUNDS)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{name} backend failed:\n{result.stderr.strip()}")
+    return np.load(out_path), json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    texts = build_corpus()
+    with tempfile.TemporaryDirectory() as workdir:
+        texts_path = os.path.join(workdir, "texts.json")
+        with open(texts_path, "w") as f:
+            json.dump(texts, f)
+        torch_vectors, torch_stats = run_backend("torch", texts_path, workdir)
+        onnx_vectors, onnx_stats = run_backend("onnx", texts_path, workdir)
+
+    # Both backends return L2-normalised vectors, so the row-wise dot product is the cosine
+    cosines = (torch_vectors * onnx_vectors).sum(axis=1)
+    report = {
+        "texts": len(texts),
+        "cosine_mean": float(cosines.mean()),
+        "cosine_min": float(cosines.min()),
+        "torch": torch_stats,
+        "onnx": onnx_stats,
+        "speedup": onnx_stats["texts_per_second"] / torch_stats["texts_per_second"],
+    }
+    print(json.dumps(report, indent=2))
+
+    if report["cosine_mean"] < MIN_MEAN_COSINE or report["cosine_min"] < MIN_COSINE:
+        print(f"❌ Parity check failed (mean >= {MIN_MEAN_COSINE}, min >= {MIN_COSINE} required)")
+        sys.exit(1)
+    print("✅ ONNX backend matches the torch reference")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+from database import SessionLocal
+import models
+from services import vector_index
+
+# Fills the local (memory-mapped) vector index from the paper_chunks table, e.g. before
+# switching VECTOR_INDEX_BACKEND to "local" on a database that already has papers.
+BATCH_SIZE = 100
+
+def build():
+    index = vector_index.LocalVectorIndex()
+    db = SessionLocal()
+    try:
+        last_id = 0
+        total = 0
+        while True:
+            papers = (
+                db.query(models.Paper)
+                .filter(models.Paper.id > last_id)
+                .order_by(models.Paper.id)
+                .limit(BATCH_SIZE)
+                .all()
+            )
+            if not papers:
+                break
+            for paper in papers:
+                if paper.document is None:
+                    continue
+                chunks = sorted(paper.document.chunks, key=lambda c: c.chunk_index)
+                if not chunks:
+                    continue
+                index.add(
+                    paper.workspace_id, paper.id, paper.title, paper.abstract,
+                    [c.content for c in chunks], [list(c.embedding) for c in chunks]
+                )
+                total += 1
+            last_id = papers[-1].id
+            db.expunge_all()
+            print(f"🔄 Indexed {total} papers so far...")
+        print(f"✅ Local index built in {index.directory}: {total} papers")
+    except Exception as e:
+        print(f"❌ Error building local index: {e}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    build()
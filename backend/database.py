@@ -1,22 +1,111 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from services import metrics
 
 load_dotenv()
 
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Pool sizing applies to each engine (sync and async) in each worker process
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 0))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+
+class PoolMetrics:
+    """
+    Time spent waiting for a pooled connection, per engine.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def record(self, waited: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.acquisitions += 1
+                self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "acquisitions": self.acquisitions,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_max": self.wait_seconds_max,
+                "wait_seconds_avg": self.wait_seconds_total / self.acquisitions if self.acquisitions else 0.0,
+            }
+
+sync_pool_metrics = PoolMetrics()
+async_pool_metrics = PoolMetrics()
+
+def _timed_pool(base, metrics: PoolMetrics):
+    class TimedPool(base):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                connection = super()._do_get()
+            except exc.TimeoutError:
+                metrics.record(time.perf_counter() - start, timed_out=True)
+                raise
+            metrics.record(time.perf_counter() - start)
+            return connection
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+def _async_url(url: str):
+    """
+    Same database through asyncpg, which spells libpq's sslmode as ssl.
+    """
+    url = make_url(url).set(drivername="postgresql+asyncpg")
+    query = dict(url.query)
+    sslmode = query.pop("sslmode", None)
+    query.pop("channel_binding", None) # libpq only
+    if sslmode:
+        query["ssl"] = sslmode
+    return url.set(query=query)
+
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
+    poolclass=_timed_pool(QueuePool, sync_pool_metrics),
     pool_pre_ping=True,
     pool_recycle=300,
-    pool_size=5,
-    max_overflow=0
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Used by the async route handlers so queries do not block the event loop
+async_engine = create_async_engine(
+    _async_url(SQLALCHEMY_DATABASE_URL),
+    poolclass=_timed_pool(AsyncAdaptedQueuePool, async_pool_metrics),
+    pool_pre_ping=True,
+    pool_recycle=300,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Every query shows up as the "db" stage in /metrics and Server-Timing
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
+
 Base = declarative_base()
 
 def get_db():
@@ -25,3 +114,13 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def pool_stats() -> dict:
+    return {
+        "sync": dict(sync_pool_metrics.snapshot(), status=engine.pool.status()),
+        "async": dict(async_pool_metrics.snapshot(), status=async_engine.pool.status()),
+    }
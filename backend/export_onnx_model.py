@@ -0,0 +1,48 @@
+import os
+import sys
+from services.embedding_backends import EMBEDDING_ONNX_DIR, EMBEDDING_ONNX_FILE, MAX_SEQ_LENGTH
+
+# Exports all-MiniLM-L6-v2 to ONNX and quantizes its weights to int8 for the "onnx"
+# embedding backend. Needs torch/transformers once, at export time only.
+HF_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+def export(out_dir: str = EMBEDDING_ONNX_DIR):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    os.makedirs(out_dir, exist_ok=True)
+    fp32_path = os.path.join(out_dir, "model_fp32.onnx")
+    int8_path = os.path.join(out_dir, EMBEDDING_ONNX_FILE)
+
+    print(f"📦 Exporting {HF_MODEL} to {fp32_path}...")
+    tokenizer = AutoTokenizer.from_pretrained(HF_MODEL)
+    tokenizer.model_max_length = MAX_SEQ_LENGTH
+    tokenizer.save_pretrained(out_dir) # Writes tokenizer.json used by the backend
+
+    model = AutoModel.from_pretrained(HF_MODEL)
+    model.eval()
+    dummy = tokenizer(["ResearchHub embedding export"], return_tensors="pt")
+    dynamic_axes = {"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+                    "token_type_ids": {0: "batch", 1: "sequence"}, "last_hidden_state": {0: "batch", 1: "sequence"}}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"], dummy["token_type_ids"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    print(f"🔧 Quantizing weights to int8 at {int8_path}...")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print("✅ Export complete. Set EMBEDDING_BACKEND=onnx to use it.")
+
+if __name__ == "__main__":
+    try:
+        export(sys.argv[1] if len(sys.argv) > 1 else EMBEDDING_ONNX_DIR)
+    except Exception as e:
+        print(f"❌ Export failed: {e}")
+        sys.exit(1)
@@ -1,12 +1,52 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import auth, research, workspaces, search
+from routers import auth, research, workspaces, search, system, admin
 import models
-from database import engine
+from database import engine, async_engine
+from services import arxiv_service, context_packer, job_service, metrics, profiler, vector_store
 
-models.Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
 
-app = FastAPI(title="ResearchHub AI API", version="0.1.0")
+# Load the embedding model during startup instead of on the first request
+EMBEDDING_WARMUP = os.getenv("EMBEDDING_WARMUP", "true").lower() == "true"
+
+async def _warmup(app: FastAPI):
+    try:
+        # Loading the tokenizer may read or fill the Hugging Face cache; keep it off the first /ask
+        await asyncio.to_thread(context_packer.count_tokens, "warmup")
+        if EMBEDDING_WARMUP:
+            await asyncio.to_thread(vector_store.warmup)
+        app.state.ready = True
+    except Exception:
+        logger.exception("Warmup failed, the instance will stay unready")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema creation and warmup happen here rather than at import time, so importing
+    # main (tests, scripts) does not touch the database or load torch.
+    app.state.ready = False
+    await asyncio.to_thread(models.Base.metadata.create_all, bind=engine)
+    await asyncio.to_thread(job_service.fail_interrupted_jobs)
+
+    # Serve /health immediately; /ready flips once the model is warm
+    warmup_task = asyncio.create_task(_warmup(app))
+    app.state.loop_monitor = None
+    if profiler.LOOP_LAG_MONITOR:
+        app.state.loop_monitor = profiler.LoopLagMonitor()
+        app.state.loop_monitor.start()
+    yield
+    warmup_task.cancel()
+    if app.state.loop_monitor is not None:
+        await app.state.loop_monitor.stop()
+    await job_service.shutdown()
+    await arxiv_service.close()
+    await async_engine.dispose()
+
+app = FastAPI(title="ResearchHub AI API", version="0.1.0", lifespan=lifespan)
 
 # CORS Configuration
 origins = [
@@ -20,16 +60,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Sync-Cursor"],
 )
 
+app.add_middleware(admin.ProfileRequestMiddleware)
+# Outermost, so the timings cover the whole request
+app.add_middleware(metrics.MetricsMiddleware)
+
 app.include_router(auth.router)
 app.include_router(research.router)
 app.include_router(workspaces.router)
 app.include_router(search.router)
-
-@app.get("/health")
-def health_check():
-    return {"status": "healthy"}
+app.include_router(system.router)
+app.include_router(admin.router)
 
 @app.get("/")
 def read_root():
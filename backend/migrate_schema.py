@@ -0,0 +1,172 @@
+import os
+from sqlalchemy import inspect, text
+from database import engine
+import models
+from services import document_store
+
+# Papers created before content-addressed documents get one document each (sha256 NULL,
+# so they are never matched by hash). Their text is compressed straight into
+# document_blobs in batches, each committed on its own so an interrupted run resumes
+# where it stopped, and the per-paper columns are dropped once every paper has moved.
+LEGACY_PAPER_COLUMNS = "ALTER TABLE papers ADD COLUMN IF NOT EXISTS document_id INTEGER REFERENCES documents(id)"
+DROP_PAPER_TEXT = "ALTER TABLE papers DROP COLUMN content, DROP COLUMN IF EXISTS embedding"
+
+# Chunks created before documents hang off their paper. Databases from before chunking
+# get paper_chunks from create_all() in its current shape and skip this step.
+LEGACY_CHUNKS = [
+    "ALTER TABLE paper_chunks ADD COLUMN IF NOT EXISTS document_id INTEGER REFERENCES documents(id) ON DELETE CASCADE",
+    "UPDATE paper_chunks SET document_id = papers.document_id FROM papers "
+    "WHERE paper_chunks.paper_id = papers.id AND paper_chunks.document_id IS NULL",
+    "ALTER TABLE paper_chunks ALTER COLUMN document_id SET NOT NULL",
+    "ALTER TABLE paper_chunks DROP COLUMN paper_id",
+]
+
+# Documents from before document_blobs: their text is compressed into blobs in batches,
+# each committed on its own so an interrupted run resumes where it stopped, and the
+# documents.content column is dropped once empty.
+DOCUMENT_TEXT_COLUMNS = (
+    "ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_bytes INTEGER, "
+    "ADD COLUMN IF NOT EXISTS compressed_bytes INTEGER"
+)
+DOCUMENT_TEXT_BATCH_SIZE = int(os.getenv("DOCUMENT_TEXT_BATCH_SIZE", 200))
+
+# The blobs are already zstd-compressed, so Postgres should not try to compress them again
+BLOB_STORAGE = "ALTER TABLE document_blobs ALTER COLUMN data SET STORAGE EXTERNAL"
+
+# Whole-document embeddings were never searched; retrieval uses the chunk embeddings
+DROP_DOCUMENT_EMBEDDING = "ALTER TABLE documents DROP COLUMN IF EXISTS embedding"
+
+# create_all() only creates missing tables, so indexes added to existing tables are
+# built here. CONCURRENTLY keeps the tables writable while the index builds.
+INDEXES = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_papers_title_fts "
+    "ON papers USING gin (to_tsvector('english', title))",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_paper_chunks_content_fts "
+    "ON paper_chunks USING gin (to_tsvector('english', content))",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_papers_document_id ON papers (document_id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_paper_chunks_document_id ON paper_chunks (document_id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_papers_owner_workspace_created "
+    "ON papers (owner_id, workspace_id, created_at, id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chat_messages_user_workspace_timestamp "
+    "ON chat_messages (user_id, workspace_id, timestamp, id)",
+]
+
+def migrate():
+    models.Base.metadata.create_all(bind=engine)
+
+    # Papers still carrying their own content have not been moved to documents yet
+    if "content" in {column["name"] for column in inspect(engine).get_columns("papers")}:
+        move_paper_text()
+    if "paper_id" in {column["name"] for column in inspect(engine).get_columns("paper_chunks")}:
+        with engine.begin() as connection:
+            for statement in LEGACY_CHUNKS:
+                print(f"🔄 {statement}")
+                connection.execute(text(statement))
+
+    if "content" in {column["name"] for column in inspect(engine).get_columns("documents")}:
+        move_document_text()
+
+    with engine.begin() as connection:
+        for statement in (BLOB_STORAGE, DROP_DOCUMENT_EMBEDDING):
+            print(f"🔄 {statement}")
+            connection.execute(text(statement))
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for statement in INDEXES:
+            print(f"🔄 {statement}")
+            connection.execute(text(statement))
+    print("✅ Schema up to date")
+
+def _text_sizes(content: str, data: bytes) -> dict:
+    return {"content_bytes": len(content.encode("utf-8")), "compressed_bytes": len(data)}
+
+def move_paper_text():
+    with engine.begin() as connection:
+        for statement in (LEGACY_PAPER_COLUMNS, DOCUMENT_TEXT_COLUMNS):
+            print(f"🔄 {statement}")
+            connection.execute(text(statement))
+
+    total = 0
+    last_id = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                text("SELECT id, content FROM papers WHERE document_id IS NULL AND id > :last_id "
+                     "ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": DOCUMENT_TEXT_BATCH_SIZE}
+            ).all()
+            if not rows:
+                break
+            for row in rows:
+                sizes = {"content_bytes": None, "compressed_bytes": None}
+                data = None
+                if row.content is not None:
+                    data = document_store.compress(row.content)
+                    sizes = _text_sizes(row.content, data)
+                document_id = connection.execute(
+                    text("INSERT INTO documents (content_bytes, compressed_bytes) "
+                         "VALUES (:content_bytes, :compressed_bytes) RETURNING id"),
+                    sizes
+                ).scalar_one()
+                if data is not None:
+                    connection.execute(
+                        text("INSERT INTO document_blobs (document_id, data) VALUES (:document_id, :data)"),
+                        {"document_id": document_id, "data": data}
+                    )
+                connection.execute(
+                    text("UPDATE papers SET document_id = :document_id WHERE id = :id"),
+                    {"document_id": document_id, "id": row.id}
+                )
+        last_id = rows[-1].id
+        total += len(rows)
+        print(f"🔄 Moved the text of {total} papers to documents so far...")
+
+    # Dropping a column only updates the catalog, so the exclusive lock is brief
+    with engine.begin() as connection:
+        print(f"🔄 {DROP_PAPER_TEXT}")
+        connection.execute(text(DROP_PAPER_TEXT))
+    print(f"✅ Moved the text of {total} papers to documents")
+
+def move_document_text():
+    with engine.begin() as connection:
+        print(f"🔄 {DOCUMENT_TEXT_COLUMNS}")
+        connection.execute(text(DOCUMENT_TEXT_COLUMNS))
+
+    total = 0
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                text("SELECT id, content FROM documents WHERE content IS NOT NULL ORDER BY id LIMIT :limit"),
+                {"limit": DOCUMENT_TEXT_BATCH_SIZE}
+            ).all()
+            if not rows:
+                break
+            blobs = []
+            sizes = []
+            for row in rows:
+                data = document_store.compress(row.content)
+                blobs.append({"document_id": row.id, "data": data})
+                sizes.append(dict(_text_sizes(row.content, data), id=row.id))
+            connection.execute(
+                text("INSERT INTO document_blobs (document_id, data) VALUES (:document_id, :data) "
+                     "ON CONFLICT (document_id) DO NOTHING"),
+                blobs
+            )
+            connection.execute(
+                text("UPDATE documents SET content = NULL, content_bytes = :content_bytes, "
+                     "compressed_bytes = :compressed_bytes WHERE id = :id"),
+                sizes
+            )
+        total += len(rows)
+        print(f"🔄 Compressed the text of {total} documents so far...")
+
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE documents DROP COLUMN content"))
+    print(f"✅ Moved the text of {total} documents to document_blobs")
+
+if __name__ == "__main__":
+    try:
+        migrate()
+    except Exception as e:
+        print(f"❌ Error migrating schema: {e}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, DateTime
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, LargeBinary, String, Text, DateTime, Index, text
 from sqlalchemy.orm import relationship, Mapped
 from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
@@ -30,6 +30,30 @@ class Workspace(Base):
     papers = relationship("Paper", back_populates="workspace")
     chat_messages = relationship("ChatMessage", back_populates="workspace")
 
+class Document(Base):
+    __tablename__ = "documents"
+
+    # Extracted text, chunks and embeddings of one PDF, shared by every Paper made from
+    # the same bytes so re-uploads skip extraction and embedding
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, index=True, nullable=True) # Of the PDF bytes; NULL for papers migrated from before documents existed
+    # Full text lives compressed in document_blobs (see services/document_store.py)
+    content_bytes = Column(Integer, nullable=True) # UTF-8 size of the text
+    compressed_bytes = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    papers = relationship("Paper", back_populates="document")
+    chunks = relationship("PaperChunk", back_populates="document", cascade="all, delete-orphan")
+    blob = relationship("DocumentBlob", uselist=False, cascade="all, delete-orphan")
+
+class DocumentBlob(Base):
+    __tablename__ = "document_blobs"
+
+    # zstd-compressed full text, kept out of the documents row so loading a document
+    # (or a paper with its document) does not read megabytes of text
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+
 class Paper(Base):
     __tablename__ = "papers"
 
@@ -37,11 +61,7 @@ class Paper(Base):
     title = Column(String, index=True)
     authors = Column(String) # Could be JSON or comma-separated
     abstract = Column(Text)
-    content = Column(Text) # Full text if needed
-    
-    # Vector Embedding (Need to decide dimension, e.g., 1536 for OpenAI, 
-    # but for Llama via HuggingFace models, maybe 384 or 768 or 1024 depending on the embedding model used)
-    embedding = Column(Vector(384)) # Using all-MiniLM-L6-v2 dimension 
+    document_id = Column(Integer, ForeignKey("documents.id"), index=True)
 
     # Link to Workspace instead of User directly (or both)
     # Sticking to workspace linking for organization
@@ -51,6 +71,39 @@ class Paper(Base):
 
     owner = relationship("User", back_populates="papers")
     workspace = relationship("Workspace", back_populates="papers")
+    document = relationship("Document", back_populates="papers")
+    summary = relationship("PaperSummary", back_populates="paper", uselist=False, cascade="all, delete-orphan")
+
+    __table_args__ = (
+        # Full-text index for the lexical leg of hybrid search (see vector_index.PgVectorIndex)
+        Index("ix_papers_title_fts", text("to_tsvector('english', title)"), postgresql_using="gin"),
+        # Serves the keyset-paginated library listing (GET /research/papers)
+        Index("ix_papers_owner_workspace_created", "owner_id", "workspace_id", "created_at", "id"),
+    )
+
+class PaperChunk(Base):
+    __tablename__ = "paper_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True, nullable=False)
+    chunk_index = Column(Integer, nullable=False) # Position of the chunk inside the document
+    content = Column(Text)
+    embedding = Column(Vector(384)) # all-MiniLM-L6-v2 dimension
+
+    document = relationship("Document", back_populates="chunks")
+
+    __table_args__ = (
+        # HNSW index for approximate nearest neighbour search on cosine distance
+        Index(
+            "ix_paper_chunks_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+        # Full-text index for the lexical leg of hybrid search
+        Index("ix_paper_chunks_content_fts", text("to_tsvector('english', content)"), postgresql_using="gin"),
+    )
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -65,3 +118,79 @@ class ChatMessage(Base):
     
     user = relationship("User", back_populates="chat_messages")
     workspace = relationship("Workspace", back_populates="chat_messages")
+
+    __table_args__ = (
+        # Serves the paginated history and the /ask history lookup
+        Index("ix_chat_messages_user_workspace_timestamp", "user_id", "workspace_id", "timestamp", "id"),
+    )
+
+class ChatMessageArchive(Base):
+    __tablename__ = "chat_messages_archive"
+
+    # Old messages moved out of chat_messages by archive_chat_history.py; not served by the API
+    id = Column(Integer, primary_key=True) # Same id as in chat_messages
+    role = Column(String)
+    content = Column(Text)
+    timestamp = Column(DateTime(timezone=True))
+    user_id = Column(Integer, index=True)
+    workspace_id = Column(Integer, nullable=True, index=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class PaperSummary(Base):
+    __tablename__ = "paper_summaries"
+
+    # Structured summary generated once at ingest, used to build short comparison prompts
+    paper_id = Column(Integer, ForeignKey("papers.id", ondelete="CASCADE"), primary_key=True)
+    methodology = Column(Text)
+    findings = Column(Text)
+    limitations = Column(Text)
+    application_area = Column(Text)
+    model = Column(String) # LLM that produced the summary
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    paper = relationship("Paper", back_populates="summary")
+
+class ComparisonCache(Base):
+    __tablename__ = "comparison_cache"
+
+    # sha256 over the sorted paper ids, a hash of each paper's prompt content and the prompt version
+    cache_key = Column(String(64), primary_key=True)
+    paper_ids = Column(String) # Sorted, comma-separated, for inspection
+    response = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class AnswerCache(Base):
+    __tablename__ = "answer_cache"
+
+    # Answers from /research/ask, reused for similar questions over the same retrieved papers
+    id = Column(Integer, primary_key=True)
+    workspace_id = Column(Integer, nullable=True) # None: the global library
+    # sha256 over the ask prompt and the sorted ids of the retrieved papers; for follow-up
+    # questions also the user id and the packed history, so those answers stay private
+    # to the user who asked (see answer_cache.context_key)
+    context_key = Column(String(64))
+    question = Column(Text)
+    embedding = Column(Vector(384)) # Question embedding, same model as PaperChunk.embedding
+    answer = Column(Text)
+    context_used = Column(Text) # JSON list of paper titles, as returned by /ask
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_answer_cache_workspace_context", "workspace_id", "context_key"),
+    )
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String) # upload, import
+    status = Column(String, default="queued", index=True) # queued, downloading, running, succeeded, failed
+    filename = Column(String) # Uploaded filename or requested title
+    source_url = Column(String, nullable=True) # Only set for imports
+    error = Column(Text, nullable=True)
+
+    paper_id = Column(Integer, ForeignKey("papers.id", ondelete="SET NULL"), nullable=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
+    workspace_id = Column(Integer, ForeignKey("workspaces.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,97 @@
+import uuid
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+
+from routers import auth
+from services import profiler
+from services.cache import TTLCache
+
+router = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(auth.get_admin_user)]
+)
+
+# Profiles of single requests, fetched afterwards with the id from the X-Profile-Id header
+_request_profiles = TTLCache(maxsize=20, ttl_seconds=3600)
+
+def _folded_response(folded: str) -> PlainTextResponse:
+    return PlainTextResponse(folded or "", media_type="text/plain")
+
+@router.post("/profile")
+async def profile_worker(
+    seconds: float = Query(10, gt=0, le=profiler.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(profiler.PROFILE_INTERVAL_MS, ge=1, le=1000)
+):
+    """
+    Samples every thread of the worker that serves this request for `seconds` and
+    returns collapsed stacks for flamegraph.pl / speedscope. With several workers,
+    repeat the call to reach the others.
+    """
+    try:
+        return _folded_response(await profiler.capture(seconds, interval_ms))
+    except profiler.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already being captured on this worker")
+
+@router.get("/profiles/{profile_id}")
+def get_request_profile(profile_id: str):
+    """
+    Collapsed stacks captured for a request sent with the X-Profile header.
+    """
+    folded = _request_profiles.get(profile_id)
+    if folded is None:
+        raise HTTPException(status_code=404, detail="Profile not found on this worker")
+    return _folded_response(folded)
+
+@router.get("/loop-lag")
+def get_loop_lag(request: Request):
+    monitor = getattr(request.app.state, "loop_monitor", None)
+    return {
+        "enabled": monitor is not None,
+        "threshold_ms": profiler.LOOP_LAG_THRESHOLD_MS,
+        "stalls": monitor.stalls if monitor is not None else 0,
+    }
+
+class ProfileRequestMiddleware:
+    """
+    Profiles a single request when an admin sends it with "X-Profile: 1". The sampler
+    covers the whole worker while the request runs (concurrent requests included) and
+    the response carries X-Profile-Id for GET /admin/profiles/{id}. Requests are served
+    normally when the caller is not an admin or another capture is running.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            sampler = profiler.Sampler().start()
+        except profiler.ProfilerBusy:
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _request_profiles.set(profile_id, sampler.stop())
+
+    @staticmethod
+    def _wants_profile(scope) -> bool:
+        headers = dict(scope.get("headers", []))
+        if headers.get(b"x-profile") not in (b"1", b"true"):
+            return False
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        scheme, _, token = authorization.partition(" ")
+        return scheme.lower() == "bearer" and auth.is_admin_token(token)
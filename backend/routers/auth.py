@@ -1,6 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, event
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -9,6 +12,7 @@ import os
 from dotenv import load_dotenv
 from dotenv import load_dotenv
 import models, schemas, database
+from services.cache import TTLCache
 
 load_dotenv()
 
@@ -47,7 +51,42 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(database.get_db)):
+@dataclass(frozen=True)
+class Principal:
+    """
+    The authenticated user as seen by the route handlers.
+    """
+    id: int
+    email: str
+
+# Short-lived, per-process: deactivation invalidates locally, the TTL bounds other workers
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 60))
+_principal_cache = TTLCache(maxsize=int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000)), ttl_seconds=PRINCIPAL_CACHE_TTL)
+
+def invalidate_principal(user_id: int):
+    """
+    Forgets a cached principal, e.g. after the user was deactivated or deleted.
+    """
+    _principal_cache.pop(user_id)
+
+@event.listens_for(models.User.is_active, "set")
+def _on_user_active_changed(target, value, oldvalue, initiator):
+    if target.id is not None:
+        invalidate_principal(target.id)
+
+@event.listens_for(models.User, "after_delete")
+def _on_user_deleted(mapper, connection, target):
+    invalidate_principal(target.id)
+
+def get_principal_cache_stats() -> dict:
+    return _principal_cache.stats()
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_async_db)) -> Principal:
+    """
+    Verifies the token and resolves its user id through the principal cache, so most
+    requests are authorized without a database query. Tokens issued before the id
+    claim existed are resolved by email.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -58,14 +97,42 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-        token_data = schemas.TokenData(email=email)
+        token_data = schemas.TokenData(email=email, user_id=payload.get("uid"))
     except JWTError:
         raise credentials_exception
-    
-    user = db.query(models.User).filter(models.User.email == token_data.email).first()
-    if user is None:
+
+    if token_data.user_id is not None:
+        principal = _principal_cache.get(token_data.user_id)
+        if principal is not None:
+            return principal
+        query = select(models.User).filter(models.User.id == token_data.user_id)
+    else:
+        query = select(models.User).filter(models.User.email == token_data.email)
+
+    user = (await db.execute(query)).scalars().first()
+    if user is None or not user.is_active:
         raise credentials_exception
-    return user
+    principal = Principal(id=user.id, email=user.email)
+    _principal_cache.set(user.id, principal)
+    return principal
+
+# Comma-separated emails allowed to use the /admin endpoints
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+def is_admin_token(token: str) -> bool:
+    """
+    Token-only admin check for middleware, where no database session is at hand.
+    """
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    return (payload.get("sub") or "").lower() in ADMIN_EMAILS
+
+async def get_admin_user(current_user: Principal = Depends(get_current_user)) -> Principal:
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
 
 # Endpoints
 @router.post("/register", response_model=schemas.UserResponse)
@@ -93,6 +160,6 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, "uid": user.id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
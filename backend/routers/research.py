@@ -1,11 +1,22 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, NamedTuple, Optional
+from datetime import datetime
+import base64
+import json
+import logging
+import os
 import database, models, schemas
-from services import pdf_service, vector_store, groq_service, arxiv_service
+from services import vector_store, groq_service, job_service, summary_service, context_packer, answer_cache
 from routers import auth
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(
     prefix="/research",
     tags=["research"]
@@ -15,134 +26,220 @@ class ChatRequest(BaseModel):
     message: str
     workspace_id: Optional[int] = None
     chat_history: Optional[List[dict]] = [] # Deprecated, using DB persistence
+    use_cache: bool = True # False always asks the model, e.g. to regenerate an answer
 
-@router.post("/upload")
+@router.post("/upload", status_code=202)
 async def upload_paper(
     workspace_id: Optional[int] = Form(None),
     file: UploadFile = File(...),
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
     if not file.filename.endswith('.pdf'):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
     
     content = await file.read()
-    text = pdf_service.extract_text_from_pdf(content)
-    
-    if not text:
-        raise HTTPException(status_code=400, detail="Could not extract text from PDF")
-    
-    # Generate abstract (naive: first 1000 chars) or use LLM to summarize
-    abstract = text[:1000] + "..." 
-    
-    # Generate embedding
-    embedding = vector_store.generate_embedding(text[:8000]) # Limit text for embedding model if needed
-    
-    new_paper = models.Paper(
-        title=file.filename,
-        authors="Unknown", # Requires metadata extraction
-        abstract=abstract,
-        content=text,
-        embedding=embedding,
-        owner_id=current_user.id,
-        workspace_id=workspace_id
-    )
     
-    db.add(new_paper)
-    db.commit()
-    db.refresh(new_paper)
+    # Extraction and embedding run in the background; the client polls /research/jobs/{id}
+    job = await _create_job(db, current_user, workspace_id, kind="upload", filename=file.filename)
+    job_service.submit_upload(job.id, content)
     
-    return {"filename": file.filename, "id": new_paper.id, "message": "Paper processed successfully"}
+    return {"filename": file.filename, "job_id": job.id, "status": job.status, "message": "Paper queued for processing"}
 
 class ImportRequest(BaseModel):
     pdf_url: str
     title: str
     workspace_id: Optional[int] = None
 
-@router.post("/import")
+@router.post("/import", status_code=202)
 async def import_paper(
     request: ImportRequest,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
 ):
-    import httpx
+    job = await _create_job(
+        db, current_user, request.workspace_id,
+        kind="import", filename=request.title, source_url=request.pdf_url
+    )
+    job_service.submit_import(job.id, request.pdf_url)
     
-    async with httpx.AsyncClient() as client:
-        response = await client.get(request.pdf_url)
-        if response.status_code != 200:
-            raise HTTPException(status_code=400, detail="Could not download PDF from URL")
-        content = response.content
+    return {"filename": request.title, "job_id": job.id, "status": job.status, "message": "Paper queued for import"}
 
-    text = pdf_service.extract_text_from_pdf(content)
-    
-    if not text:
-        raise HTTPException(status_code=400, detail="Could not extract text from PDF")
-    
-    # Generate abstract (naive: first 1000 chars)
-    abstract = text[:1000] + "..." 
-    
-    # Generate embedding
-    embedding = vector_store.generate_embedding(text[:8000])
-    
-    new_paper = models.Paper(
-        title=request.title,
-        authors="Unknown", # Requires metadata or scraping
-        abstract=abstract,
-        content=text,
-        embedding=embedding,
-        owner_id=current_user.id,
-        workspace_id=request.workspace_id
+class ImportItem(BaseModel):
+    # arXiv search results can be posted as they are, extra fields are ignored
+    pdf_url: str
+    title: str
+
+class BatchImportRequest(BaseModel):
+    items: List[ImportItem]
+    workspace_id: Optional[int] = None
+
+# Upper bound on papers per batch request; never more than an idle worker can queue
+IMPORT_BATCH_MAX = min(int(os.getenv("IMPORT_BATCH_MAX", 50)), job_service.INGEST_MAX_PENDING)
+
+@router.post("/import/batch", status_code=202)
+async def import_papers(
+    request: BatchImportRequest,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Queues one import job per item. The batch is downloaded concurrently and embedded
+    in one pass; the response lists each item's job (or why it was not queued) in
+    request order.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No papers to import")
+    if len(request.items) > IMPORT_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {IMPORT_BATCH_MAX} papers can be imported at once")
+
+    results = [{"filename": item.title, "pdf_url": item.pdf_url} for item in request.items]
+    accepted, seen = [], set()
+    for result in results:
+        if not result["pdf_url"].startswith(("http://", "https://")):
+            result.update(status="rejected", error="Invalid PDF URL")
+        elif result["pdf_url"] in seen:
+            result.update(status="rejected", error="Duplicate of an earlier item")
+        else:
+            seen.add(result["pdf_url"])
+            accepted.append(result)
+
+    jobs = await job_service.create_import_jobs(
+        db, current_user.id, request.workspace_id,
+        [(result["filename"], result["pdf_url"]) for result in accepted]
     )
+    for result, job in zip(accepted, jobs):
+        if job is None:
+            result.update(status="rejected", error="Too many papers are being processed, please retry shortly")
+            continue
+        result.update(job_id=job.id, status=job.status)
+    job_service.submit_import_batch([(job.id, job.source_url) for job in jobs if job is not None])
+
+    return {
+        "queued": sum(job is not None for job in jobs),
+        "rejected": sum(result["status"] == "rejected" for result in results),
+        "items": results
+    }
+
+async def _create_job(db: AsyncSession, current_user: auth.Principal, workspace_id: Optional[int], **fields) -> models.IngestJob:
+    try:
+        return await job_service.create_job(db, owner_id=current_user.id, workspace_id=workspace_id, **fields)
+    except job_service.JobQueueFull:
+        raise HTTPException(status_code=503, detail="Too many papers are being processed, please retry shortly")
+
+def _job_response(job: models.IngestJob) -> dict:
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "filename": job.filename,
+        "paper_id": job.paper_id,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at
+    }
+
+@router.get("/jobs/{job_id}")
+def get_job_status(
+    job_id: int,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: Session = Depends(database.get_db)
+):
+    job = db.query(models.IngestJob).filter(
+        models.IngestJob.id == job_id,
+        models.IngestJob.owner_id == current_user.id
+    ).first()
     
-    db.add(new_paper)
-    db.commit()
-    db.refresh(new_paper)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
     
-    return {"filename": request.title, "id": new_paper.id, "message": "Paper imported successfully"}
+    return _job_response(job)
 
-@router.post("/ask")
-async def ask_research_assistant(
-    request: ChatRequest,
-    current_user: models.User = Depends(auth.get_current_user),
+@router.get("/jobs")
+def get_jobs_status(
+    ids: List[int] = Query(...),
+    current_user: auth.Principal = Depends(auth.get_current_user),
     db: Session = Depends(database.get_db)
 ):
+    """
+    Status of several jobs at once, e.g. the jobs of a batch import. Unknown ids are omitted.
+    """
+    jobs = db.query(models.IngestJob).filter(
+        models.IngestJob.id.in_(ids),
+        models.IngestJob.owner_id == current_user.id
+    ).all()
+    return [_job_response(job) for job in jobs]
+
+# Number of papers retrieved per question; the context packer decides how much of them fits
+ASK_RETRIEVAL_LIMIT = int(os.getenv("ASK_RETRIEVAL_LIMIT", 5))
+# History rows fetched per question before packing to HISTORY_TOKEN_BUDGET
+ASK_HISTORY_LIMIT = int(os.getenv("ASK_HISTORY_LIMIT", 10))
+
+ASK_SYSTEM_PROMPT = (
+    "You are an intelligent Research Assistant. Use the following context from the user's papers to answer their question. "
+    "Formulate your answer based ONLY on the provided context if possible. If the answer is not in the context, state that."
+    "\n\nContext:\n{context}"
+)
+
+class PreparedAsk(NamedTuple):
+    messages: Optional[List[dict]] # None when answered from the cache
+    context_used: List[str]
+    token_usage: Optional[dict]
+    cache_key: Optional[str]
+    query_embedding: list
+    cached: Optional[str]
+
+async def _prepare_ask(request: ChatRequest, current_user: auth.Principal, db: AsyncSession) -> PreparedAsk:
+    """
+    Retrieves context and history, stores the user's message and returns the
+    messages for the LLM, the papers used as context and the prompt's token counts.
+    A cached answer to a similar question over the same papers and conversation skips
+    the prompt.
+    """
+    # The retrieval legs check out their own connections. Hand back the one the auth
+    # lookup may have taken, or concurrent requests can hold the whole pool and wait on it.
+    await db.close()
+
     # 1. Search for relevant papers
     # Filter by workspace to ensure context isolation
-    relevant_papers = vector_store.search_similar_papers(
-        db, 
+    query_embedding = await vector_store.generate_embedding_async(request.message)
+    relevant_papers = await vector_store.search_similar_papers(
         request.message, 
         workspace_id=request.workspace_id,
-        limit=3
+        limit=ASK_RETRIEVAL_LIMIT,
+        query_embedding=query_embedding
     )
-    
-    context = ""
-    for paper in relevant_papers:
-        context += f"Title: {paper.title}\nAbstract: {paper.abstract}\n\n"
-    
-    # 2. Construct Prompt
-    system_prompt = (
-        "You are an intelligent Research Assistant. Use the following context from the user's papers to answer their question. "
-        "Formulate your answer based ONLY on the provided context if possible. If the answer is not in the context, state that."
-        "\n\nContext:\n" + context
-    )
-    
-    messages = [{"role": "system", "content": system_prompt}]
-    
+
     # Retrieve chat history from DB
-    history_query = db.query(models.ChatMessage).filter(
+    history_query = select(models.ChatMessage).filter(
         models.ChatMessage.user_id == current_user.id
     )
     if request.workspace_id:
         history_query = history_query.filter(models.ChatMessage.workspace_id == request.workspace_id)
     else:
         history_query = history_query.filter(models.ChatMessage.workspace_id == None)
-        
-    recent_history = history_query.order_by(models.ChatMessage.timestamp.desc()).limit(5).all()
+
+    recent_history = (await db.execute(
+        history_query.order_by(models.ChatMessage.timestamp.desc(), models.ChatMessage.id.desc()).limit(ASK_HISTORY_LIMIT)
+    )).scalars().all()
     # Re-order to chronological
-    for msg in reversed(recent_history):
-        messages.append({"role": msg.role, "content": msg.content})
-    
-    messages.append({"role": "user", "content": request.message})
+    history = [{"role": msg.role, "content": msg.content} for msg in reversed(recent_history)]
+
+    cache_key = None
+    cached = None
+    if answer_cache.ANSWER_CACHE_ENABLED:
+        # The history that fits the prompt conditions the answer as much as the papers do
+        prompt_history, _ = context_packer.pack_history(history)
+        cache_key = answer_cache.context_key(
+            ASK_SYSTEM_PROMPT, [paper["paper_id"] for paper in relevant_papers], prompt_history, current_user.id
+        )
+        if request.use_cache:
+            cached = await answer_cache.lookup(db, request.workspace_id, cache_key, query_embedding)
+
+    messages, token_usage = None, None
+    if cached is None:
+        # 2. Construct Prompt within the token budgets
+        messages, token_usage = context_packer.build_messages(ASK_SYSTEM_PROMPT, relevant_papers, history, request.message)
     
     # Save User Message
     user_msg_db = models.ChatMessage(
@@ -152,67 +249,230 @@ async def ask_research_assistant(
         workspace_id=request.workspace_id
     )
     db.add(user_msg_db)
-    db.commit()
-    
-    # 3. Get Response
-    response = await groq_service.get_chat_response(messages)
-    
-    # Save Assistant Message
+    await db.commit()
+
+    if cached is not None:
+        return PreparedAsk(None, cached["context_used"], None, cache_key, query_embedding, cached["answer"])
+    return PreparedAsk(messages, token_usage["papers_used"], token_usage, cache_key, query_embedding, None)
+
+async def _cache_answer(db: AsyncSession, request: ChatRequest, prepared: PreparedAsk, answer: str):
+    if prepared.cache_key is None or not answer:
+        return
+    await answer_cache.store(
+        db, request.workspace_id, prepared.cache_key, request.message,
+        prepared.query_embedding, answer, prepared.context_used
+    )
+
+async def _save_assistant_message(db: AsyncSession, content: str, user_id: int, workspace_id: Optional[int]):
     ai_msg_db = models.ChatMessage(
         role="assistant", 
-        content=response, 
-        user_id=current_user.id, 
-        workspace_id=request.workspace_id
+        content=content, 
+        user_id=user_id, 
+        workspace_id=workspace_id
     )
     db.add(ai_msg_db)
-    db.commit()
+    await db.commit()
+
+def _sse(data: dict, event: Optional[str] = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+def _sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream, which would defeat its purpose
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/ask")
+async def ask_research_assistant(
+    request: ChatRequest,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    prepared = await _prepare_ask(request, current_user, db)
+    if prepared.cached is not None:
+        await _save_assistant_message(db, prepared.cached, current_user.id, request.workspace_id)
+        return {"response": prepared.cached, "context_used": prepared.context_used, "token_usage": None, "cached": True}
+    
+    # 3. Get Response
+    try:
+        response = await groq_service.get_chat_response(prepared.messages, user_id=current_user.id)
+    except groq_service.LLMUnavailable as e:
+        logger.warning("Error calling Groq API: %s", e)
+        raise HTTPException(status_code=503, detail=groq_service.ERROR_RESPONSE)
     
-    return {"response": response, "context_used": [p.title for p in relevant_papers]}
+    # Save Assistant Message
+    await _save_assistant_message(db, response, current_user.id, request.workspace_id)
+    await _cache_answer(db, request, prepared, response)
+    
+    return {"response": response, "context_used": prepared.context_used, "token_usage": prepared.token_usage, "cached": False}
+
+@router.post("/ask/stream")
+async def ask_research_assistant_stream(
+    request: ChatRequest,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Same as /ask, but streams the answer as server-sent events:
+    "data: {"delta": ...}" per token batch, then "event: done" (or "event: error").
+    The assistant message is stored once the stream has finished. A cached answer is
+    sent as a single delta and "done" carries "cached": true.
+    """
+    prepared = await _prepare_ask(request, current_user, db)
+    user_id = current_user.id
+
+    async def events():
+        if prepared.cached is not None:
+            async with database.AsyncSessionLocal() as session:
+                await _save_assistant_message(session, prepared.cached, user_id, request.workspace_id)
+            yield _sse({"delta": prepared.cached})
+            yield _sse({"context_used": prepared.context_used, "token_usage": None, "cached": True}, event="done")
+            return
+
+        parts = []
+        try:
+            async for delta in groq_service.stream_chat_response(prepared.messages, user_id=user_id):
+                parts.append(delta)
+                yield _sse({"delta": delta})
+        except Exception as e:
+            logger.exception("Error streaming from Groq API")
+            yield _sse({"detail": groq_service.ERROR_RESPONSE}, event="error")
+            return
+
+        # The request's session may already be closed once the response is streaming
+        async with database.AsyncSessionLocal() as session:
+            await _save_assistant_message(session, "".join(parts), user_id, request.workspace_id)
+            await _cache_answer(session, request, prepared, "".join(parts))
+        yield _sse({"context_used": prepared.context_used, "token_usage": prepared.token_usage, "cached": False}, event="done")
+
+    return _sse_response(events())
+
+def _encode_cursor(timestamp: datetime, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{row_id}".encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Page size of GET /research/chat/history
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", 50))
+CHAT_PAGE_MAX = 200
 
 @router.get("/chat/history")
 def get_chat_history(
+    response: Response,
     workspace_id: Optional[int] = None,
-    current_user: models.User = Depends(auth.get_current_user),
+    limit: int = Query(CHAT_PAGE_SIZE, ge=1, le=CHAT_PAGE_MAX),
+    cursor: Optional[str] = None,
+    since: Optional[str] = None,
+    current_user: auth.Principal = Depends(auth.get_current_user),
     db: Session = Depends(database.get_db)
 ):
-    query = db.query(models.ChatMessage).filter(models.ChatMessage.user_id == current_user.id)
+    """
+    Returns chat messages in chronological order, one page at a time.
+    By default the latest page is returned; X-Next-Cursor (passed back as cursor) pages
+    towards older messages. For incremental sync pass the X-Sync-Cursor of the previous
+    response as since to get only newer messages; a full page means more are waiting.
+    """
+    query = db.query(
+        models.ChatMessage.id, models.ChatMessage.role,
+        models.ChatMessage.content, models.ChatMessage.timestamp
+    ).filter(models.ChatMessage.user_id == current_user.id)
     if workspace_id:
         query = query.filter(models.ChatMessage.workspace_id == workspace_id)
     else:
         query = query.filter(models.ChatMessage.workspace_id == None)
-        
-    messages = query.order_by(models.ChatMessage.timestamp).all()
-    return [{"role": msg.role, "content": msg.content, "timestamp": msg.timestamp} for msg in messages]
+
+    key = tuple_(models.ChatMessage.timestamp, models.ChatMessage.id)
+    if since:
+        messages = query.filter(key > _decode_cursor(since)).order_by(
+            models.ChatMessage.timestamp, models.ChatMessage.id
+        ).limit(limit).all()
+    else:
+        if cursor:
+            query = query.filter(key < _decode_cursor(cursor))
+        # Newest first through the index, one extra row tells whether older ones exist
+        messages = query.order_by(
+            models.ChatMessage.timestamp.desc(), models.ChatMessage.id.desc()
+        ).limit(limit + 1).all()
+        if len(messages) > limit:
+            messages = messages[:limit]
+            response.headers["X-Next-Cursor"] = _encode_cursor(messages[-1].timestamp, messages[-1].id)
+        messages.reverse()
+
+    if messages:
+        response.headers["X-Sync-Cursor"] = _encode_cursor(messages[-1].timestamp, messages[-1].id)
+    elif since:
+        response.headers["X-Sync-Cursor"] = since
+    return [{"id": msg.id, "role": msg.role, "content": msg.content, "timestamp": msg.timestamp} for msg in messages]
+
+# Page size of GET /research/papers; the next page is requested with the X-Next-Cursor header
+PAPERS_PAGE_SIZE = int(os.getenv("PAPERS_PAGE_SIZE", 50))
+PAPERS_PAGE_MAX = 200
 
 @router.get("/papers")
 def get_papers(
+    response: Response,
     workspace_id: Optional[int] = None,
-    current_user: models.User = Depends(auth.get_current_user),
+    limit: int = Query(PAPERS_PAGE_SIZE, ge=1, le=PAPERS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    current_user: auth.Principal = Depends(auth.get_current_user),
     db: Session = Depends(database.get_db)
 ):
-    query = db.query(models.Paper).filter(models.Paper.owner_id == current_user.id)
+    """
+    Lists the user's papers newest first, one page at a time. Pagination is keyset
+    based on (created_at, id) and served from ix_papers_owner_workspace_created, so
+    every page costs the same however large the library is.
+    """
+    query = db.query(
+        models.Paper.id, models.Paper.title, models.Paper.abstract,
+        models.Paper.authors, models.Paper.created_at
+    ).filter(models.Paper.owner_id == current_user.id)
     if workspace_id:
         query = query.filter(models.Paper.workspace_id == workspace_id)
     else:
         query = query.filter(models.Paper.workspace_id == None)
-        
-    papers = query.order_by(models.Paper.created_at.desc()).all()
+    if cursor:
+        query = query.filter(tuple_(models.Paper.created_at, models.Paper.id) < _decode_cursor(cursor))
+
+    # One extra row tells whether another page follows
+    papers = query.order_by(models.Paper.created_at.desc(), models.Paper.id.desc()).limit(limit + 1).all()
+    if len(papers) > limit:
+        papers = papers[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(papers[-1].created_at, papers[-1].id)
     return [{"id": p.id, "title": p.title, "abstract": p.abstract, "authors": p.authors, "created_at": p.created_at} for p in papers]
 
 class CompareRequest(BaseModel):
     paper_ids: List[int]
 
-@router.post("/compare")
-async def compare_papers(
-    request: CompareRequest,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(database.get_db)
-):
-    # Fetch papers
-    papers = db.query(models.Paper).filter(
-        models.Paper.id.in_(request.paper_ids),
-        models.Paper.owner_id == current_user.id
-    ).all()
+# Bump when the comparison prompt changes so cached comparisons are regenerated
+COMPARE_PROMPT_VERSION = "2"
+
+async def _prepare_compare(request: CompareRequest, current_user: auth.Principal, db: AsyncSession):
+    """
+    Returns (messages, cache_key, cached_response). The prompt uses each paper's
+    precomputed summary when there is one and falls back to its abstract.
+    """
+    # Only the columns used in the prompt, not the full text or embedding
+    papers = (await db.execute(
+        select(
+            models.Paper.id, models.Paper.title, models.Paper.abstract,
+            models.PaperSummary.methodology, models.PaperSummary.findings,
+            models.PaperSummary.limitations, models.PaperSummary.application_area
+        )
+        .outerjoin(models.PaperSummary, models.PaperSummary.paper_id == models.Paper.id)
+        .filter(
+            models.Paper.id.in_(request.paper_ids),
+            models.Paper.owner_id == current_user.id
+        )
+        .order_by(models.Paper.id)
+    )).all()
     
     if len(papers) < 2:
         raise HTTPException(status_code=400, detail="Select at least 2 papers to compare")
@@ -220,7 +480,19 @@ async def compare_papers(
     # Construct Context
     context = ""
     for p in papers:
-        context += f"Paper ID {p.id}: {p.title}\nAbstract: {p.abstract}\n\n"
+        if p.methodology is not None:
+            context += (
+                f"Paper ID {p.id}: {p.title}\nMethodology: {p.methodology}\nFindings: {p.findings}\n"
+                f"Limitations: {p.limitations}\nApplication Area: {p.application_area}\n\n"
+            )
+        else:
+            context += f"Paper ID {p.id}: {p.title}\nAbstract: {p.abstract}\n\n"
+
+    # Same papers with the same content give the same prompt, so the answer can be reused
+    cache_key = summary_service.content_hash(COMPARE_PROMPT_VERSION, context)
+    cached = await db.get(models.ComparisonCache, cache_key)
+    if cached is not None:
+        return None, cache_key, cached.response
 
     # Prompt
     prompt = (
@@ -231,9 +503,70 @@ async def compare_papers(
         f"Papers to Compare:\n{context}"
     )
 
-    messages = [{"role": "user", "content": prompt}]
+    return [{"role": "user", "content": prompt}], cache_key, None
+
+async def _store_comparison(db: AsyncSession, cache_key: str, paper_ids: List[int], response: str):
+    db.add(models.ComparisonCache(
+        cache_key=cache_key,
+        paper_ids=",".join(str(i) for i in sorted(set(paper_ids))),
+        response=response
+    ))
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent request stored the same comparison first
+        await db.rollback()
+
+@router.post("/compare")
+async def compare_papers(
+    request: CompareRequest,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    messages, cache_key, cached = await _prepare_compare(request, current_user, db)
+    if cached is not None:
+        return {"comparison": cached, "cached": True}
     
     # Get Response
-    response = await groq_service.get_chat_response(messages)
+    try:
+        response = await groq_service.get_chat_response(messages, user_id=current_user.id)
+    except groq_service.LLMUnavailable as e:
+        logger.warning("Error calling Groq API: %s", e)
+        raise HTTPException(status_code=503, detail=groq_service.ERROR_RESPONSE)
+    await _store_comparison(db, cache_key, request.paper_ids, response)
     
-    return {"comparison": response}
+    return {"comparison": response, "cached": False}
+
+@router.post("/compare/stream")
+async def compare_papers_stream(
+    request: CompareRequest,
+    current_user: auth.Principal = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    """
+    Same as /compare, streamed as server-sent events like /ask/stream.
+    """
+    messages, cache_key, cached = await _prepare_compare(request, current_user, db)
+    user_id = current_user.id
+
+    async def events():
+        if cached is not None:
+            yield _sse({"delta": cached})
+            yield _sse({"cached": True}, event="done")
+            return
+
+        parts = []
+        try:
+            async for delta in groq_service.stream_chat_response(messages, user_id=user_id):
+                parts.append(delta)
+                yield _sse({"delta": delta})
+        except Exception as e:
+            logger.exception("Error streaming from Groq API")
+            yield _sse({"detail": groq_service.ERROR_RESPONSE}, event="error")
+            return
+
+        async with database.AsyncSessionLocal() as session:
+            await _store_comparison(session, cache_key, request.paper_ids, "".join(parts))
+        yield _sse({"cached": False}, event="done")
+
+    return _sse_response(events())
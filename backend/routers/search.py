@@ -23,5 +23,7 @@ async def search_arxiv(query: str, max_results: int = 10):
     if not query:
         raise HTTPException(status_code=400, detail="Query parameter is required")
     
-    results = arxiv_service.search_arxiv(query, max_results=max_results)
-    return results
+    try:
+        return await arxiv_service.search_arxiv(query, max_results=max_results)
+    except arxiv_service.ArxivUnavailable:
+        raise HTTPException(status_code=502, detail="arXiv is unavailable, please retry shortly")
@@ -0,0 +1,73 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
+import database
+from services import answer_cache, arxiv_service, document_store, groq_service, metrics, vector_store
+from routers import auth
+
+router = APIRouter(
+    tags=["system"]
+)
+
+@router.get("/ready")
+def readiness_check(request: Request):
+    """
+    Readiness probe: unlike /health, fails until startup warmup is done and the database answers.
+    """
+    if not getattr(request.app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    try:
+        with database.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except Exception:
+        return JSONResponse(status_code=503, content={"status": "database unavailable"})
+    return {"status": "ready"}
+
+@router.get("/stats/embeddings", dependencies=[Depends(auth.get_admin_user)])
+def get_embedding_stats():
+    """
+    Micro-batching statistics of the query embedding executor.
+    """
+    return vector_store.get_embedding_stats()
+
+@router.get("/stats/cache", dependencies=[Depends(auth.get_admin_user)])
+def get_cache_stats():
+    """
+    Hit/miss counters of the query embedding, search result, arXiv, principal,
+    answer and document text caches.
+    """
+    return dict(
+        vector_store.get_cache_stats(),
+        arxiv=arxiv_service.get_cache_stats(),
+        principals=auth.get_principal_cache_stats(),
+        answers=answer_cache.get_stats(),
+        documents=document_store.get_cache_stats()
+    )
+
+@router.get("/stats/retrieval", dependencies=[Depends(auth.get_admin_user)])
+def get_retrieval_stats():
+    """
+    Latency of the vector and full-text retrieval legs.
+    """
+    return vector_store.get_retrieval_stats()
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Per-stage and per-route latency histograms in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/stats/db", dependencies=[Depends(auth.get_admin_user)])
+def get_db_stats():
+    """
+    Connection pool usage and time spent waiting for a connection.
+    """
+    return database.pool_stats()
+
+@router.get("/stats/llm", dependencies=[Depends(auth.get_admin_user)])
+def get_llm_stats():
+    """
+    Groq client concurrency, retry and request coalescing counters.
+    """
+    return groq_service.get_stats()
@@ -4,6 +4,7 @@ from typing import List, Optional
 from pydantic import BaseModel
 import database, models, schemas
 from routers import auth
+from services import vector_store, answer_cache
 
 router = APIRouter(
     prefix="/workspaces",
@@ -26,7 +27,7 @@ class WorkspaceResponse(BaseModel):
 @router.post("/", response_model=WorkspaceResponse)
 def create_workspace(
     workspace: WorkspaceCreate,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
     db: Session = Depends(database.get_db)
 ):
     db_workspace = models.Workspace(**workspace.dict(), owner_id=current_user.id)
@@ -37,7 +38,7 @@ def create_workspace(
 
 @router.get("/", response_model=List[WorkspaceResponse])
 def get_workspaces(
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
     db: Session = Depends(database.get_db)
 ):
     return db.query(models.Workspace).filter(models.Workspace.owner_id == current_user.id).all()
@@ -45,7 +46,7 @@ def get_workspaces(
 @router.delete("/{workspace_id}")
 def delete_workspace(
     workspace_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
+    current_user: auth.Principal = Depends(auth.get_current_user),
     db: Session = Depends(database.get_db)
 ):
     workspace = db.query(models.Workspace).filter(
@@ -60,13 +61,21 @@ def delete_workspace(
     
     # 1. Delete Chat Messages associated with this workspace
     db.query(models.ChatMessage).filter(models.ChatMessage.workspace_id == workspace_id).delete()
+    db.query(models.ChatMessageArchive).filter(models.ChatMessageArchive.workspace_id == workspace_id).delete()
     
     # 2. Unlink Papers (Set workspace_id to NULL) 
     # Use update() for bulk operation
     db.query(models.Paper).filter(models.Paper.workspace_id == workspace_id).update({models.Paper.workspace_id: None})
     
-    # 3. Delete the Workspace itself
+    # 3. Drop cached answers of the workspace and of the global library it joins
+    answer_cache.invalidate(db, workspace_id)
+    answer_cache.invalidate(db, None)
+    
+    # 4. Delete the Workspace itself
     db.delete(workspace)
     db.commit()
     
+    # Papers left this workspace and joined the global library: move their index entries too
+    vector_store.unlink_workspace(workspace_id)
+    
     return {"message": "Workspace deleted successfully"}
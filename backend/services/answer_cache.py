@@ -0,0 +1,93 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from services import metrics, summary_service
+
+# Answers to /research/ask are reused for questions whose embedding is at least this
+# cosine-similar to a cached one, asked in the same workspace over the same retrieved
+# papers and after the same conversation (see context_key).
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 7 * 24 * 3600))
+
+_hits = 0
+_misses = 0
+
+def context_key(prompt: str, paper_ids: List[int], history: List[dict], user_id: int) -> str:
+    """
+    Answers to opening questions are shared by everyone searching the same papers.
+    Answers that followed a conversation are private: reused only for the same user
+    with the same preceding messages.
+    """
+    parts = [prompt, ",".join(str(i) for i in sorted(set(paper_ids)))]
+    if history:
+        parts += [str(user_id), json.dumps(history, sort_keys=True)]
+    return summary_service.content_hash(*parts)
+
+def _scope(workspace_id: Optional[int]):
+    if workspace_id is None:
+        return models.AnswerCache.workspace_id == None
+    return models.AnswerCache.workspace_id == workspace_id
+
+@metrics.timed("answer_cache.lookup")
+async def lookup(db: AsyncSession, workspace_id: Optional[int], key: str, embedding: list) -> Optional[dict]:
+    """
+    Returns {"answer", "context_used", "similarity"} of the closest cached answer, or
+    None when there is none above ANSWER_CACHE_THRESHOLD.
+    """
+    global _hits, _misses
+    distance = models.AnswerCache.embedding.cosine_distance(embedding).label("distance")
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=ANSWER_CACHE_TTL)
+    row = (await db.execute(
+        select(models.AnswerCache.answer, models.AnswerCache.context_used, distance)
+        .filter(_scope(workspace_id), models.AnswerCache.context_key == key, models.AnswerCache.created_at >= cutoff)
+        .order_by(distance)
+        .limit(1)
+    )).first()
+    if row is None or 1 - row.distance < ANSWER_CACHE_THRESHOLD:
+        _misses += 1
+        return None
+    _hits += 1
+    return {"answer": row.answer, "context_used": json.loads(row.context_used), "similarity": 1 - row.distance}
+
+async def store(db: AsyncSession, workspace_id: Optional[int], key: str, question: str, embedding: list,
+                answer: str, context_used: List[str]):
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=ANSWER_CACHE_TTL)
+    # Expired answers for the same papers are dropped here rather than by a separate job
+    await db.execute(delete(models.AnswerCache).where(
+        _scope(workspace_id), models.AnswerCache.context_key == key, models.AnswerCache.created_at < cutoff
+    ))
+    db.add(models.AnswerCache(
+        workspace_id=workspace_id,
+        context_key=key,
+        question=question,
+        embedding=embedding,
+        answer=answer,
+        context_used=json.dumps(context_used)
+    ))
+    await db.commit()
+
+def invalidate(db: Session, workspace_id: Optional[int]):
+    """
+    Drops the cached answers of a workspace (or the global library) whose papers
+    changed. Committed by the caller.
+    """
+    db.execute(delete(models.AnswerCache).where(_scope(workspace_id)))
+
+def get_stats() -> dict:
+    lookups = _hits + _misses
+    return {
+        "enabled": ANSWER_CACHE_ENABLED,
+        "threshold": ANSWER_CACHE_THRESHOLD,
+        "ttl_seconds": ANSWER_CACHE_TTL,
+        "hits": _hits,
+        "misses": _misses,
+        "hit_rate": _hits / lookups if lookups else 0.0,
+    }
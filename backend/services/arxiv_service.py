@@ -1,26 +1,106 @@
-import arxiv
+import asyncio
+import os
+import xml.etree.ElementTree as ET
+from typing import List, Optional
 
-def search_arxiv(query: str, max_results: int = 5):
+import httpx
+
+from services import metrics
+from services.cache import TTLCache
+
+# Overridable so tests can point the client at a local stand-in server
+ARXIV_API_URL = os.getenv("ARXIV_API_URL", "https://export.arxiv.org/api/query")
+ARXIV_TIMEOUT = float(os.getenv("ARXIV_TIMEOUT", 10))
+# arXiv asks clients to keep their request rate low, so the pool stays small
+ARXIV_MAX_CONNECTIONS = int(os.getenv("ARXIV_MAX_CONNECTIONS", 4))
+ARXIV_CACHE_TTL = float(os.getenv("ARXIV_CACHE_TTL", 3600))
+
+_ATOM = "{http://www.w3.org/2005/Atom}"
+
+class ArxivUnavailable(Exception):
     """
-    Searches arXiv for papers matching the query.
+    arXiv could not be reached or returned an unusable response.
     """
+
+_client: Optional[httpx.AsyncClient] = None
+_cache = TTLCache(maxsize=int(os.getenv("ARXIV_CACHE_SIZE", 512)), ttl_seconds=ARXIV_CACHE_TTL)
+# (query, max_results) -> task fetching it, shared by identical concurrent requests
+_inflight = {}
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=ARXIV_TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=ARXIV_MAX_CONNECTIONS, max_keepalive_connections=ARXIV_MAX_CONNECTIONS),
+        )
+    return _client
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _text(entry: ET.Element, tag: str) -> str:
+    # arXiv wraps long titles and abstracts over several lines
+    return " ".join((entry.findtext(f"{_ATOM}{tag}") or "").split())
+
+def _parse_feed(body: bytes) -> List[dict]:
     try:
-        search = arxiv.Search(
-            query=query,
-            max_results=max_results,
-            sort_by=arxiv.SortCriterion.Relevance
+        feed = ET.fromstring(body)
+    except ET.ParseError as e:
+        raise ArxivUnavailable(f"Malformed arXiv response: {e}") from e
+
+    results = []
+    for entry in feed.findall(f"{_ATOM}entry"):
+        pdf_url = next(
+            (link.get("href") for link in entry.findall(f"{_ATOM}link") if link.get("title") == "pdf"),
+            _text(entry, "id").replace("/abs/", "/pdf/"),
         )
-        
-        results = []
-        for result in search.results():
-            results.append({
-                "title": result.title,
-                "authors": [author.name for author in result.authors],
-                "summary": result.summary,
-                "pdf_url": result.pdf_url,
-                "published": result.published.strftime("%Y-%m-%d")
-            })
-        return results
-    except Exception as e:
-        print(f"Error searching arXiv: {e}")
-        return []
+        results.append({
+            "title": _text(entry, "title"),
+            "authors": [_text(author, "name") for author in entry.findall(f"{_ATOM}author")],
+            "summary": _text(entry, "summary"),
+            "pdf_url": pdf_url,
+            "published": _text(entry, "published")[:10],
+        })
+    return results
+
+@metrics.timed("arxiv")
+async def _fetch(query: str, max_results: int) -> List[dict]:
+    params = {
+        # Passed through as the arxiv package did, so field prefixes (au:, ti:, cat:) work
+        "search_query": query,
+        "max_results": max_results,
+        "sortBy": "relevance",
+    }
+    try:
+        response = await _get_client().get(ARXIV_API_URL, params=params)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        raise ArxivUnavailable(f"arXiv request failed: {e}") from e
+    return _parse_feed(response.content)
+
+async def search_arxiv(query: str, max_results: int = 5) -> List[dict]:
+    """
+    Searches arXiv for papers matching the query. Results are cached and identical
+    concurrent searches share one upstream request. Raises ArxivUnavailable.
+    """
+    key = (" ".join(query.lower().split()), max_results)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.create_task(_fetch(query, max_results))
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: one caller disconnecting must not cancel the request for the others
+    results = await asyncio.shield(task)
+    _cache.set(key, results)
+    return results
+
+def get_cache_stats() -> dict:
+    return dict(_cache.stats(), inflight=len(_inflight))
@@ -0,0 +1,38 @@
+import os
+from typing import Iterable, Iterator, List
+
+# Chunk sizes are counted in whitespace-separated words. all-MiniLM-L6-v2 truncates
+# input at 256 word pieces, so ~200 words keeps most chunks inside the model window.
+CHUNK_SIZE_WORDS = int(os.getenv("CHUNK_SIZE_WORDS", 200))
+CHUNK_OVERLAP_WORDS = int(os.getenv("CHUNK_OVERLAP_WORDS", 40))
+
+def iter_chunks(pieces: Iterable[str], size: int = CHUNK_SIZE_WORDS, overlap: int = CHUNK_OVERLAP_WORDS) -> Iterator[str]:
+    """
+    Splits a stream of text pieces (e.g. pages) into overlapping word windows.
+    Chunks are yielded as soon as enough words are buffered, so callers can start
+    embedding before the whole document has been read.
+    """
+    if overlap >= size:
+        raise ValueError("Chunk overlap must be smaller than chunk size")
+
+    step = size - overlap
+    buffer: List[str] = []
+    emitted = False
+    for piece in pieces:
+        if not piece:
+            continue
+        buffer.extend(piece.split())
+        while len(buffer) >= size:
+            yield " ".join(buffer[:size])
+            emitted = True
+            buffer = buffer[step:]
+
+    # Flush the tail unless it is fully contained in the previous chunk's overlap
+    if buffer and (not emitted or len(buffer) > overlap):
+        yield " ".join(buffer)
+
+def chunk_text(text: str, size: int = CHUNK_SIZE_WORDS, overlap: int = CHUNK_OVERLAP_WORDS) -> List[str]:
+    """
+    Splits a full text into overlapping chunks.
+    """
+    return list(iter_chunks([text], size=size, overlap=overlap))
@@ -0,0 +1,177 @@
+import logging
+import os
+import re
+import threading
+from typing import List, Optional, Tuple
+
+from services.embedding_backends import EMBEDDING_ONNX_DIR
+
+logger = logging.getLogger(__name__)
+
+# Token budgets for the retrieved passages and for the chat history sent to the LLM
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 3000))
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", 1000))
+# A passage is trimmed to fit the remaining budget only if at least this much room is left
+MIN_PASSAGE_TOKENS = int(os.getenv("MIN_PASSAGE_TOKENS", 64))
+# Passages sharing more of their words than this with an already packed one are skipped
+DUPLICATE_OVERLAP = float(os.getenv("CONTEXT_DUPLICATE_OVERLAP", 0.8))
+# tokenizer.json of the chat model (e.g. Llama 3) for exact counts. Without it the
+# embedding model's WordPiece tokenizer is used: it splits English into somewhat more
+# tokens than Llama 3, so budgets err on the safe side. Tokens are only estimated from
+# characters when neither can be loaded.
+CONTEXT_TOKENIZER_PATH = os.getenv("CONTEXT_TOKENIZER_PATH")
+CONTEXT_TOKENIZER_MODEL = os.getenv("CONTEXT_TOKENIZER_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+def _load_tokenizer():
+    from tokenizers import Tokenizer
+
+    if CONTEXT_TOKENIZER_PATH:
+        return Tokenizer.from_file(CONTEXT_TOKENIZER_PATH)
+    # Written next to the ONNX model by export_onnx_model.py
+    exported = os.path.join(EMBEDDING_ONNX_DIR, "tokenizer.json")
+    if os.path.exists(exported):
+        return Tokenizer.from_file(exported)
+    # From the Hugging Face cache the torch backend's model download fills
+    return Tokenizer.from_pretrained(CONTEXT_TOKENIZER_MODEL)
+
+def _get_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        with _tokenizer_lock:
+            if not _tokenizer_loaded:
+                try:
+                    tokenizer = _load_tokenizer()
+                    # The embedding tokenizer truncates at 256 pieces; counts must not
+                    tokenizer.no_truncation()
+                    tokenizer.no_padding()
+                    _tokenizer = tokenizer
+                except Exception as e:
+                    logger.warning("No tokenizer for context packing, estimating tokens from characters: %s", e)
+                _tokenizer_loaded = True
+    return _tokenizer
+
+def count_tokens(text: str) -> int:
+    """
+    Counts tokens with the local tokenizer, or estimates ~4 characters per token
+    (close to Llama 3 on English prose) when none could be loaded.
+    """
+    if not text:
+        return 0
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return (len(text) + 3) // 4
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if max_tokens <= 0:
+        return ""
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        encoding = tokenizer.encode(text, add_special_tokens=False)
+        if len(encoding.ids) <= max_tokens:
+            return text
+        return text[:encoding.offsets[max_tokens - 1][1]]
+    return text[:max_tokens * 4]
+
+def _words(text: str) -> set:
+    return set(re.findall(r"\w+", text.lower()))
+
+def _is_duplicate(words: set, packed: List[set]) -> bool:
+    if not words:
+        return True
+    return any(len(words & other) / len(words) > DUPLICATE_OVERLAP for other in packed)
+
+def pack_passages(papers: List[dict], budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[str, dict]:
+    """
+    Packs retrieved chunks (as returned by vector_store.search_similar_papers) into a
+    context string of at most `budget` tokens. Chunks are taken best score first,
+    near-duplicates (e.g. overlapping neighbours) are skipped and the last chunk
+    that does not fit is trimmed. Returns the context and its accounting.
+    """
+    candidates = [
+        (chunk["score"], paper["paper_id"], paper["title"], chunk["content"])
+        for paper in papers
+        for chunk in paper["chunks"]
+    ]
+    candidates.sort(key=lambda c: c[0], reverse=True)
+
+    selected = {} # paper_id -> (title, [passages]) in order of first selection
+    packed_words = []
+    used = 0
+    dropped = 0
+    for score, paper_id, title, content in candidates:
+        words = _words(content)
+        if _is_duplicate(words, packed_words):
+            dropped += 1
+            continue
+
+        header = 0 if paper_id in selected else count_tokens(f"Title: {title}\nRelevant passages:\n")
+        cost = header + count_tokens(content)
+        if used + cost > budget:
+            room = budget - used - header
+            if room < MIN_PASSAGE_TOKENS:
+                dropped += 1
+                continue
+            content = truncate_to_tokens(content, room)
+            cost = header + count_tokens(content)
+
+        selected.setdefault(paper_id, (title, []))[1].append(content)
+        packed_words.append(words)
+        used += cost
+
+    context = ""
+    for title, passages in selected.values():
+        context += f"Title: {title}\nRelevant passages:\n" + "\n...\n".join(passages) + "\n\n"
+
+    return context, {
+        "context": count_tokens(context),
+        "context_budget": budget,
+        "passages_used": len(packed_words),
+        "passages_dropped": dropped,
+        "papers_used": [title for title, _ in selected.values()],
+    }
+
+def pack_history(history: List[dict], budget: int = HISTORY_TOKEN_BUDGET) -> Tuple[List[dict], dict]:
+    """
+    Keeps the most recent messages (given chronologically) that fit in `budget`.
+    """
+    kept = []
+    used = 0
+    for message in reversed(history):
+        cost = count_tokens(message["content"])
+        if used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    return kept, {
+        "history": used,
+        "history_budget": budget,
+        "history_used": len(kept),
+        "history_dropped": len(history) - len(kept),
+    }
+
+def build_messages(system_prompt: str, papers: List[dict], history: List[dict], question: str,
+                   context_budget: Optional[int] = None, history_budget: Optional[int] = None) -> Tuple[List[dict], dict]:
+    """
+    Assembles the chat messages for a RAG prompt. system_prompt receives the packed
+    context through a "{context}" placeholder. Returns the messages and a token report.
+    """
+    context, context_usage = pack_passages(papers, CONTEXT_TOKEN_BUDGET if context_budget is None else context_budget)
+    kept_history, history_usage = pack_history(history, HISTORY_TOKEN_BUDGET if history_budget is None else history_budget)
+
+    system = system_prompt.format(context=context)
+    messages = [{"role": "system", "content": system}] + kept_history + [{"role": "user", "content": question}]
+
+    usage = {
+        "system": count_tokens(system),
+        "question": count_tokens(question),
+        **context_usage,
+        **history_usage,
+    }
+    usage["total"] = usage["system"] + usage["history"] + usage["question"]
+    return messages, usage
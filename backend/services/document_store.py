@@ -0,0 +1,53 @@
+import os
+from typing import Optional
+
+import zstandard
+from sqlalchemy.orm import Session
+
+import models
+from services import metrics
+from services.cache import TTLCache
+
+# Full document text is kept zstd-compressed in document_blobs, out of the documents
+# row. Extracted paper text compresses roughly 3-4x at the default level.
+DOCUMENT_ZSTD_LEVEL = int(os.getenv("DOCUMENT_ZSTD_LEVEL", 10))
+# Decompressed texts kept per worker; each is up to a few MB, so the cache stays small
+_text_cache = TTLCache(
+    maxsize=int(os.getenv("DOCUMENT_TEXT_CACHE_SIZE", 32)),
+    ttl_seconds=float(os.getenv("DOCUMENT_TEXT_CACHE_TTL", 600))
+)
+
+def compress(text: str) -> bytes:
+    # Compressor objects are not thread-safe and ingest compresses from worker threads
+    return zstandard.ZstdCompressor(level=DOCUMENT_ZSTD_LEVEL).compress(text.encode("utf-8"))
+
+def decompress(data: bytes) -> str:
+    return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+
+def attach_text(document: models.Document, text: str):
+    """
+    Sets a new document's compressed text and size metadata; stored with the document.
+    """
+    data = compress(text)
+    document.content_bytes = len(text.encode("utf-8"))
+    document.compressed_bytes = len(data)
+    document.blob = models.DocumentBlob(data=data)
+
+def get_text(db: Session, document_id: int) -> Optional[str]:
+    """
+    Full text of a document, decompressed on first access and cached. None when the
+    document has no stored text.
+    """
+    text = _text_cache.get(document_id)
+    if text is not None:
+        return text
+    data = db.query(models.DocumentBlob.data).filter(models.DocumentBlob.document_id == document_id).scalar()
+    if data is None:
+        return None
+    with metrics.span("document.decompress"):
+        text = decompress(data)
+    _text_cache.set(document_id, text)
+    return text
+
+def get_cache_stats() -> dict:
+    return _text_cache.stats()
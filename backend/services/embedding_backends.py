@@ -0,0 +1,132 @@
+import hashlib
+import os
+import re
+import threading
+from typing import List
+
+import numpy as np
+
+# all-MiniLM-L6-v2 produces 384-d vectors and truncates input at 256 word pieces
+EMBEDDING_DIMENSION = 384
+MAX_SEQ_LENGTH = 256
+
+# Directory produced by export_onnx_model.py
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "onnx_models", "all-MiniLM-L6-v2"))
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "model_int8.onnx")
+# 0 lets ONNX Runtime pick; set to 1-2 when several API workers share a node
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", 0))
+
+class EmbeddingBackend:
+    """
+    Turns texts into L2-normalised float32 vectors of EMBEDDING_DIMENSION.
+    """
+    name = "base"
+    dimension = EMBEDDING_DIMENSION
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        raise NotImplementedError
+
+class TorchBackend(EmbeddingBackend):
+    """
+    Reference implementation: the SentenceTransformer model on PyTorch. Calls are
+    serialized: the query batcher and ingest threads encode concurrently, and the HF
+    fast tokenizer inside model.encode fails with "Already borrowed" when shared.
+    """
+    name = "torch"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self._lock = threading.Lock()
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+        # Locked per forward pass, so query batches get in between the passes of a large ingest call
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            with self._lock:
+                outputs.append(self.model.encode(texts[start:start + batch_size], batch_size=batch_size))
+        return np.vstack(outputs).astype(np.float32)
+
+class OnnxInt8Backend(EmbeddingBackend):
+    """
+    The same model exported to ONNX with int8 dynamically quantized weights, run on
+    ONNX Runtime's CPU provider. Does not import torch, which keeps worker RSS low.
+    Reproduces the SentenceTransformer pipeline: mean pooling over the attention
+    mask followed by L2 normalisation.
+    """
+    name = "onnx-int8"
+
+    def __init__(self, model_dir: str = EMBEDDING_ONNX_DIR, model_file: str = EMBEDDING_ONNX_FILE):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, model_file)
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"{model_path} not found, run export_onnx_model.py first")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if EMBEDDING_ONNX_THREADS:
+            options.intra_op_num_threads = EMBEDDING_ONNX_THREADS
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        # The tokenizer is not safe to share between threads; session.run is
+        self._tokenizer_lock = threading.Lock()
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            with self._tokenizer_lock:
+                encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {
+                "input_ids": input_ids,
+                "attention_mask": attention_mask,
+                "token_type_ids": np.zeros_like(input_ids),
+            }
+            hidden = self.session.run(None, {k: v for k, v in feeds.items() if k in self.input_names})[0]
+
+            mask = attention_mask[..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+            outputs.append(pooled / np.clip(norms, 1e-12, None))
+        return np.vstack(outputs).astype(np.float32)
+
+class HashingBackend(EmbeddingBackend):
+    """
+    Feature hashing of lower-cased words into EMBEDDING_DIMENSION signed buckets.
+    Needs no model and costs microseconds, so benchmarks and CI measure the API rather
+    than the encoder. Only lexical overlap is captured; not for real deployments.
+    """
+    name = "hash"
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+                vectors[row, h % self.dimension] += 1.0 if h >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.clip(norms, 1e-12, None)
+
+def create_backend(name: str, model_name: str) -> EmbeddingBackend:
+    """
+    Builds the backend selected by EMBEDDING_BACKEND ("torch", "onnx" or "hash").
+    """
+    if name == "torch":
+        return TorchBackend(model_name)
+    if name in ("onnx", "onnx-int8"):
+        return OnnxInt8Backend()
+    if name == "hash":
+        return HashingBackend()
+    raise ValueError(f"Unknown embedding backend: {name}")
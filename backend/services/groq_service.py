@@ -1,26 +1,234 @@
+import asyncio
+import hashlib
+import json
 import os
+import random
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Optional
+
+import groq
 from groq import AsyncGroq
 from dotenv import load_dotenv
+from services import context_packer, metrics
 
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Seconds per attempt; retries are done here so the SDK's own are disabled
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", 60))
+GROQ_RETRIES = int(os.getenv("GROQ_RETRIES", 3))
+# Calls in flight per worker, and per user so one user cannot take every slot
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", 8))
+GROQ_PER_USER_CONCURRENCY = int(os.getenv("GROQ_PER_USER_CONCURRENCY", 2))
+# Quota per worker (divide the account quota by the worker count); 0 disables the limit
+GROQ_REQUESTS_PER_MINUTE = float(os.getenv("GROQ_REQUESTS_PER_MINUTE", 0))
+GROQ_TOKENS_PER_MINUTE = float(os.getenv("GROQ_TOKENS_PER_MINUTE", 0))
+# The token quota counts answers too; this is charged before a call and corrected after
+GROQ_COMPLETION_TOKEN_ESTIMATE = int(os.getenv("GROQ_COMPLETION_TOKEN_ESTIMATE", 512))
 
 client = AsyncGroq(
     api_key=GROQ_API_KEY,
+    timeout=GROQ_TIMEOUT,
+    max_retries=0,
 )
 
-async def get_chat_response(messages, model="llama-3.3-70b-versatile", temperature=0.3):
+# Shown to clients when the model could not be reached; never stored as an answer
+ERROR_RESPONSE = "I apologize, but I encountered an error while processing your request."
+
+class LLMUnavailable(Exception):
+    """Raised when Groq could not produce a response, after retries where sensible."""
+
+_RETRYABLE = (groq.RateLimitError, groq.APIConnectionError, groq.InternalServerError)
+
+class TokenBucket:
+    """
+    Allows `per_minute` units per minute with bursts up to the same amount. Waiters
+    are served in arrival order.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1):
+        if self.capacity <= 0:
+            return
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, amount: float):
+        """
+        Charges `amount` more units without waiting (refunds when negative), e.g. once
+        the actual usage of a call is known. Later callers wait off any deficit.
+        """
+        if self.capacity <= 0:
+            return
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+_request_bucket = TokenBucket(GROQ_REQUESTS_PER_MINUTE)
+_token_bucket = TokenBucket(GROQ_TOKENS_PER_MINUTE)
+_global_slots: Optional[asyncio.Semaphore] = None
+_user_slots = {} # user_id -> [semaphore, callers holding or waiting for it]
+# Prompt hash -> task, shared by identical concurrent calls
+_inflight = {}
+_retries = 0
+_coalesced = 0
+
+@asynccontextmanager
+async def _slot(user_id: Optional[int]):
+    global _global_slots
+    if _global_slots is None:
+        _global_slots = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+
+    entry = None
+    if user_id is not None and GROQ_PER_USER_CONCURRENCY > 0:
+        entry = _user_slots.get(user_id)
+        if entry is None:
+            entry = _user_slots[user_id] = [asyncio.Semaphore(GROQ_PER_USER_CONCURRENCY), 0]
+        entry[1] += 1
+    try:
+        async with AsyncExitStack() as stack:
+            if entry is not None:
+                await stack.enter_async_context(entry[0])
+            await stack.enter_async_context(_global_slots)
+            yield
+    finally:
+        if entry is not None:
+            entry[1] -= 1
+            if not entry[1]:
+                _user_slots.pop(user_id, None)
+
+def _estimate_tokens(messages) -> int:
+    """
+    Prompt tokens plus GROQ_COMPLETION_TOKEN_ESTIMATE for the answer.
+    """
+    prompt = sum(context_packer.count_tokens(message.get("content") or "") for message in messages)
+    return prompt + GROQ_COMPLETION_TOKEN_ESTIMATE
+
+def _backoff(attempt: int, error: Exception) -> float:
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after", "") if response is not None else ""
+    try:
+        return min(float(retry_after), 30)
+    except ValueError:
+        return min(2 ** attempt * (0.5 + random.random()), 30)
+
+async def _open(user_id: Optional[int], tokens: int, **kwargs):
+    """
+    Calls the completions API within the concurrency and rate limits, retrying rate
+    limits, connection errors, timeouts and 5xx with jittered backoff. Backoff and
+    waiting for quota happen outside the slot, so they do not hold back calls that
+    are ready to go. Returns (response, slot) with the slot still held: streams keep it
+    until they finish, so close it with `await slot.aclose()`.
+    """
+    global _retries
+    error = None
+    for attempt in range(GROQ_RETRIES + 1):
+        if attempt:
+            _retries += 1
+            async with metrics.span("llm.retry_wait"):
+                await asyncio.sleep(_backoff(attempt - 1, error))
+        async with metrics.span("llm.quota_wait"):
+            await _request_bucket.acquire(1)
+            await _token_bucket.acquire(tokens)
+        slot = AsyncExitStack()
+        await slot.enter_async_context(_slot(user_id))
+        try:
+            return await client.chat.completions.create(**kwargs), slot
+        except _RETRYABLE as e:
+            await slot.aclose()
+            error = e
+        except groq.APIError as e:
+            await slot.aclose()
+            raise LLMUnavailable(str(e)) from e
+        except BaseException:
+            await slot.aclose()
+            raise
+    raise LLMUnavailable(f"Groq unavailable after {GROQ_RETRIES + 1} attempts: {error}") from error
+
+async def _complete(messages, model, temperature, response_format, user_id) -> str:
+    extra = {"response_format": response_format} if response_format else {}
+    estimate = _estimate_tokens(messages)
+    completion, slot = await _open(
+        user_id, estimate,
+        messages=messages, model=model, temperature=temperature, **extra
+    )
+    await slot.aclose()
+    if completion.usage is not None:
+        _token_bucket.adjust(completion.usage.total_tokens - estimate)
+    return completion.choices[0].message.content or ""
+
+@metrics.timed("llm")
+async def get_chat_response(messages, model="llama-3.3-70b-versatile", temperature=0.3, response_format=None, user_id: Optional[int] = None) -> str:
     """
     Generates a response from Groq based on the message history.
+    Pass response_format={"type": "json_object"} to request JSON output and user_id to
+    apply the per-user concurrency limit. Identical concurrent prompts share one call.
+    Raises LLMUnavailable.
+    """
+    global _coalesced
+    key = hashlib.sha256(
+        json.dumps([model, temperature, response_format, messages], sort_keys=True).encode()
+    ).hexdigest()
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.create_task(_complete(messages, model, temperature, response_format, user_id))
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        _coalesced += 1
+    # shield: one caller disconnecting must not cancel the call for the others
+    return await asyncio.shield(task)
+
+async def stream_chat_response(messages, model="llama-3.3-70b-versatile", temperature=0.3, user_id: Optional[int] = None):
+    """
+    Streams the response from Groq, yielding content deltas as they arrive. Opening
+    the stream is retried like get_chat_response; errors after that are raised to the
+    caller, which decides how to report them mid-stream.
     """
+    start = time.perf_counter()
+    first_token = True
     try:
-        chat_completion = await client.chat.completions.create(
-            messages=messages,
-            model=model,
-            temperature=temperature,
+        stream, slot = await _open(
+            user_id, _estimate_tokens(messages),
+            messages=messages, model=model, temperature=temperature, stream=True
         )
-        return chat_completion.choices[0].message.content
-    except Exception as e:
-        print(f"Error calling Groq API: {e}")
-        return "I apologize, but I encountered an error while processing your request."
+        parts = []
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token:
+                        metrics.record("llm.first_token", time.perf_counter() - start)
+                        first_token = False
+                    parts.append(delta)
+                    yield delta
+        finally:
+            await slot.aclose()
+            if GROQ_TOKENS_PER_MINUTE > 0:
+                # Streams carry no usage, so the answer is counted like the prompt was
+                _token_bucket.adjust(context_packer.count_tokens("".join(parts)) - GROQ_COMPLETION_TOKEN_ESTIMATE)
+    finally:
+        metrics.record("llm.stream", time.perf_counter() - start)
+
+def get_stats() -> dict:
+    return {
+        "inflight": len(_inflight),
+        "coalesced": _coalesced,
+        "retries": _retries,
+        "active_users": len(_user_slots),
+        "free_slots": _global_slots._value if _global_slots is not None else GROQ_MAX_CONCURRENCY,
+    }
@@ -0,0 +1,476 @@
+import asyncio
+import hashlib
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+import httpx
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from database import SessionLocal
+from services import pdf_service, vector_store, vector_index, chunk_service, summary_service, answer_cache, document_store, metrics
+
+logger = logging.getLogger(__name__)
+
+# Number of documents processed at the same time. Everything past this waits in the queue.
+INGEST_MAX_CONCURRENCY = int(os.getenv("INGEST_MAX_CONCURRENCY", 2))
+# Upper bound on queued + running jobs held by one API worker (uploads keep their bytes in memory).
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", 50))
+# Chunks embedded per forward pass while pages are still being extracted.
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", 64))
+# Unfinished jobs untouched for this long are considered lost (e.g. the worker restarted).
+INGEST_STALE_SECONDS = int(os.getenv("INGEST_STALE_SECONDS", 3600))
+
+# PDF downloads share one connection pool and are limited per host, independently of
+# the ingest slots above, so a batch import fetches many papers while others are embedded.
+IMPORT_MAX_CONNECTIONS = int(os.getenv("IMPORT_MAX_CONNECTIONS", 20))
+IMPORT_PER_HOST_CONCURRENCY = int(os.getenv("IMPORT_PER_HOST_CONCURRENCY", 4))
+IMPORT_RETRIES = int(os.getenv("IMPORT_RETRIES", 3))
+IMPORT_TIMEOUT = float(os.getenv("IMPORT_TIMEOUT", 60))
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_MB", 50)) * 1024 * 1024
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class JobQueueFull(Exception):
+    """Raised when the ingestion queue cannot accept more work."""
+
+_semaphore: Optional[asyncio.Semaphore] = None
+_tasks = set() # Strong references so running jobs are not garbage collected
+_pending = 0 # Jobs queued or running in _tasks; a batch import is one task for many jobs
+_client: Optional[httpx.AsyncClient] = None
+_host_semaphores = {}
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(INGEST_MAX_CONCURRENCY)
+    return _semaphore
+
+def pending_jobs() -> int:
+    return _pending
+
+async def create_job(db: AsyncSession, owner_id: int, workspace_id: Optional[int], kind: str, filename: str, source_url: Optional[str] = None) -> models.IngestJob:
+    """
+    Records a queued job. Fails fast when this worker already holds too many jobs.
+    """
+    if pending_jobs() >= INGEST_MAX_PENDING:
+        raise JobQueueFull()
+
+    job = models.IngestJob(
+        kind=kind,
+        status="queued",
+        filename=filename,
+        source_url=source_url,
+        owner_id=owner_id,
+        workspace_id=workspace_id
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+async def create_import_jobs(db: AsyncSession, owner_id: int, workspace_id: Optional[int], items: List[Tuple[str, str]]) -> List[Optional[models.IngestJob]]:
+    """
+    Records one queued import job per (title, pdf_url) in a single commit. Items past
+    this worker's remaining capacity get None instead of a job.
+    """
+    capacity = max(INGEST_MAX_PENDING - pending_jobs(), 0)
+    jobs = [
+        models.IngestJob(
+            kind="import",
+            status="queued",
+            filename=title,
+            source_url=pdf_url,
+            owner_id=owner_id,
+            workspace_id=workspace_id
+        )
+        for title, pdf_url in items[:capacity]
+    ]
+    db.add_all(jobs)
+    await db.commit()
+    for job in jobs:
+        await db.refresh(job)
+    return jobs + [None] * (len(items) - len(jobs))
+
+def submit_upload(job_id: int, content: bytes):
+    _spawn(_run_job(job_id, content=content))
+
+def submit_import(job_id: int, pdf_url: str):
+    _spawn(_run_job(job_id, pdf_url=pdf_url))
+
+def submit_import_batch(jobs: List[Tuple[int, str]]):
+    """
+    Runs the (job_id, pdf_url) jobs of a batch import together, see _run_import_batch.
+    """
+    if jobs:
+        _spawn(_run_import_batch(jobs), job_count=len(jobs))
+
+def _spawn(coro, job_count: int = 1):
+    global _pending
+    # Jobs outlive the upload/import request, so they must not record into its stages
+    task = metrics.run_detached(asyncio.create_task, coro)
+    _tasks.add(task)
+    _pending += job_count
+
+    def done(task):
+        global _pending
+        _tasks.discard(task)
+        _pending -= job_count
+
+    task.add_done_callback(done)
+
+def _update_job(job_id: int, **fields):
+    db = SessionLocal()
+    try:
+        db.query(models.IngestJob).filter(models.IngestJob.id == job_id).update(fields)
+        db.commit()
+    finally:
+        db.close()
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            follow_redirects=True,
+            timeout=IMPORT_TIMEOUT,
+            limits=httpx.Limits(max_connections=IMPORT_MAX_CONNECTIONS, max_keepalive_connections=IMPORT_MAX_CONNECTIONS),
+        )
+    return _client
+
+def _host_semaphore(pdf_url: str) -> asyncio.Semaphore:
+    host = httpx.URL(pdf_url).host
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = _host_semaphores[host] = asyncio.Semaphore(IMPORT_PER_HOST_CONCURRENCY)
+    return semaphore
+
+class _RetryableDownload(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+async def _download_once(pdf_url: str) -> bytes:
+    async with _get_client().stream("GET", pdf_url) as response:
+        if response.status_code in _RETRY_STATUSES:
+            retry_after = response.headers.get("retry-after", "")
+            raise _RetryableDownload(
+                f"HTTP {response.status_code}",
+                float(retry_after) if retry_after.isdigit() else None
+            )
+        if response.status_code != 200:
+            raise ValueError("Could not download PDF from URL")
+        if int(response.headers.get("content-length") or 0) > IMPORT_MAX_BYTES:
+            raise ValueError("PDF is too large")
+
+        content = bytearray()
+        async for part in response.aiter_bytes():
+            content.extend(part)
+            if len(content) > IMPORT_MAX_BYTES:
+                raise ValueError("PDF is too large")
+        return bytes(content)
+
+async def _download_pdf(pdf_url: str) -> bytes:
+    """
+    Downloads through the shared client, retrying connection errors, 429 and 5xx
+    responses with jittered exponential backoff.
+    """
+    async with _host_semaphore(pdf_url):
+        for attempt in range(IMPORT_RETRIES + 1):
+            try:
+                return await _download_once(pdf_url)
+            except (httpx.TransportError, _RetryableDownload) as e:
+                if attempt == IMPORT_RETRIES:
+                    raise ValueError(f"Could not download PDF from URL: {e}") from e
+                delay = getattr(e, "retry_after", None) or 2 ** attempt * (0.5 + random.random())
+                await asyncio.sleep(min(delay, 30))
+
+async def _fail_job(job_id: int, error: Exception):
+    logger.error("Ingest job %s failed", job_id, exc_info=error)
+    try:
+        await asyncio.to_thread(_update_job, job_id, status="failed", error=str(error))
+    except Exception:
+        logger.exception("Could not record failure of ingest job %s", job_id)
+
+async def _summarize_after_ingest(paper_id: int):
+    # The summary only waits on the LLM, so it runs after releasing the ingest slot.
+    # Without one, /compare falls back to the abstract.
+    try:
+        await _summarize_paper(paper_id)
+    except Exception:
+        logger.exception("Could not summarize paper %s", paper_id)
+
+async def _run_job(job_id: int, content: Optional[bytes] = None, pdf_url: Optional[str] = None):
+    paper_id = None
+    try:
+        # Downloads do not take an ingest slot, so imports fetch while other papers embed
+        if content is None:
+            await asyncio.to_thread(_update_job, job_id, status="downloading")
+            content = await _download_pdf(pdf_url)
+
+        # Known PDFs reuse the stored document and skip extraction and embedding entirely
+        sha256 = hashlib.sha256(content).hexdigest()
+        document_id = await asyncio.to_thread(_find_document, sha256)
+        if document_id is not None:
+            paper_id = await asyncio.to_thread(_store_paper, job_id, document_id)
+        else:
+            async with _get_semaphore():
+                await asyncio.to_thread(_update_job, job_id, status="running")
+                text, chunks, embeddings = await asyncio.to_thread(_extract_and_embed, content)
+                document_id = await asyncio.to_thread(_store_document, sha256, text, chunks, embeddings)
+                paper_id = await asyncio.to_thread(_store_paper, job_id, document_id, chunks, embeddings)
+        await asyncio.to_thread(_update_job, job_id, status="succeeded", paper_id=paper_id)
+    except Exception as e:
+        await _fail_job(job_id, e)
+
+    if paper_id is not None:
+        await _summarize_after_ingest(paper_id)
+
+async def _run_import_batch(jobs: List[Tuple[int, str]]):
+    """
+    Downloads every item concurrently and extracts the new PDFs (INGEST_MAX_CONCURRENCY
+    at a time), then embeds the chunks of all of them in one generate_embeddings call
+    instead of one per paper. Each item keeps its own job status; a failed item does
+    not fail the others.
+    """
+    paper_ids = []
+
+    async def fetch_and_extract(job_id: int, pdf_url: str):
+        try:
+            await asyncio.to_thread(_update_job, job_id, status="downloading")
+            content = await _download_pdf(pdf_url)
+            sha256 = hashlib.sha256(content).hexdigest()
+            document_id = await asyncio.to_thread(_find_document, sha256)
+            if document_id is not None:
+                paper_id = await asyncio.to_thread(_store_paper, job_id, document_id)
+                await asyncio.to_thread(_update_job, job_id, status="succeeded", paper_id=paper_id)
+                paper_ids.append(paper_id)
+                return None
+            async with _get_semaphore():
+                await asyncio.to_thread(_update_job, job_id, status="running")
+                text, chunks = await asyncio.to_thread(_extract, content)
+            return job_id, sha256, text, chunks
+        except Exception as e:
+            await _fail_job(job_id, e)
+            return None
+
+    extracted = [item for item in await asyncio.gather(*(fetch_and_extract(*job) for job in jobs)) if item]
+
+    if extracted:
+        all_chunks = [chunk for _, _, _, chunks in extracted for chunk in chunks]
+        try:
+            embeddings = await asyncio.to_thread(vector_store.generate_embeddings, all_chunks, INGEST_EMBED_BATCH)
+        except Exception as e:
+            for job_id, _, _, _ in extracted:
+                await _fail_job(job_id, e)
+            extracted = []
+
+        offset = 0
+        for job_id, sha256, text, chunks in extracted:
+            document_embeddings = embeddings[offset:offset + len(chunks)]
+            offset += len(chunks)
+            try:
+                document_id = await asyncio.to_thread(_store_document, sha256, text, chunks, document_embeddings)
+                paper_id = await asyncio.to_thread(_store_paper, job_id, document_id, chunks, document_embeddings)
+                await asyncio.to_thread(_update_job, job_id, status="succeeded", paper_id=paper_id)
+                paper_ids.append(paper_id)
+            except Exception as e:
+                await _fail_job(job_id, e)
+
+    for paper_id in paper_ids:
+        await _summarize_after_ingest(paper_id)
+
+async def _summarize_paper(paper_id: int):
+    if await asyncio.to_thread(_copy_summary, paper_id):
+        return
+    title, text = await asyncio.to_thread(_get_summary_input, paper_id)
+    summary = await summary_service.summarize_paper(title, text)
+    if summary is not None:
+        await asyncio.to_thread(_store_summary, paper_id, summary)
+
+def _copy_summary(paper_id: int) -> bool:
+    """
+    Reuses the summary of another paper made from the same document, if there is one.
+    """
+    db = SessionLocal()
+    try:
+        document_id = db.query(models.Paper.document_id).filter(models.Paper.id == paper_id).scalar()
+        existing = (
+            db.query(models.PaperSummary)
+            .join(models.Paper, models.Paper.id == models.PaperSummary.paper_id)
+            .filter(models.Paper.document_id == document_id, models.Paper.id != paper_id)
+            .first()
+        )
+        if existing is None:
+            return False
+        db.merge(models.PaperSummary(
+            paper_id=paper_id,
+            methodology=existing.methodology,
+            findings=existing.findings,
+            limitations=existing.limitations,
+            application_area=existing.application_area,
+            model=existing.model
+        ))
+        db.commit()
+        return True
+    finally:
+        db.close()
+
+def _get_summary_input(paper_id: int) -> Tuple[str, str]:
+    db = SessionLocal()
+    try:
+        title, document_id = (
+            db.query(models.Paper.title, models.Paper.document_id)
+            .filter(models.Paper.id == paper_id)
+            .one()
+        )
+        return title, document_store.get_text(db, document_id) or ""
+    finally:
+        db.close()
+
+def _store_summary(paper_id: int, summary: dict):
+    db = SessionLocal()
+    try:
+        db.merge(models.PaperSummary(paper_id=paper_id, model=summary_service.SUMMARY_MODEL, **summary))
+        db.commit()
+    finally:
+        db.close()
+
+def _extract(content: bytes) -> Tuple[str, List[str]]:
+    """
+    Extracts and chunks a PDF without embedding it. Returns (text, chunks).
+    """
+    pages = [page for page in pdf_service.iter_pages(content) if page]
+    text = "".join(page + "\n" for page in pages)
+    if not text.strip():
+        raise ValueError("Could not extract text from PDF")
+    return text, list(chunk_service.iter_chunks(pages))
+
+def _extract_and_embed(content: bytes):
+    """
+    Streams pages out of the PDF worker processes into the chunker and embeds chunks
+    in batches as they fill, so embedding overlaps with extraction of later pages.
+    Runs in a worker thread: the encoder releases the GIL during the forward pass.
+    Returns (text, chunks, embeddings), one embedding per chunk.
+    """
+    pages = []
+
+    def collect_pages():
+        for page in pdf_service.iter_pages(content):
+            if page:
+                pages.append(page)
+                yield page
+
+    chunks, embeddings, pending = [], [], []
+    for chunk in chunk_service.iter_chunks(collect_pages()):
+        pending.append(chunk)
+        if len(pending) >= INGEST_EMBED_BATCH:
+            embeddings.extend(vector_store.generate_embeddings(pending))
+            chunks.extend(pending)
+            pending = []
+
+    text = "".join(page + "\n" for page in pages)
+    if not text.strip():
+        raise ValueError("Could not extract text from PDF")
+
+    if pending:
+        embeddings.extend(vector_store.generate_embeddings(pending))
+        chunks.extend(pending)
+    return text, chunks, embeddings
+
+def _find_document(sha256: str) -> Optional[int]:
+    db = SessionLocal()
+    try:
+        return db.query(models.Document.id).filter(models.Document.sha256 == sha256).scalar()
+    finally:
+        db.close()
+
+def _store_document(sha256: str, text: str, chunks: list, embeddings: list) -> int:
+    """
+    Saves the extracted document once per PDF. If the same PDF finished ingesting
+    concurrently, its document is used instead.
+    """
+    db = SessionLocal()
+    try:
+        document = models.Document(
+            sha256=sha256,
+            chunks=[
+                models.PaperChunk(chunk_index=i, content=chunk, embedding=embedding)
+                for i, (chunk, embedding) in enumerate(zip(chunks, embeddings))
+            ]
+        )
+        document_store.attach_text(document, text)
+        db.add(document)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return db.query(models.Document.id).filter(models.Document.sha256 == sha256).scalar()
+        return document.id
+    finally:
+        db.close()
+
+def _store_paper(job_id: int, document_id: int, chunks: Optional[list] = None, embeddings: Optional[list] = None) -> int:
+    """
+    Saves the paper for the job's owner on top of a stored document. chunks/embeddings
+    are only read from the database when the vector index keeps its own copy.
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(models.IngestJob).filter(models.IngestJob.id == job_id).one()
+        content = document_store.get_text(db, document_id) or ""
+        paper = models.Paper(
+            title=job.filename,
+            authors="Unknown", # Requires metadata extraction
+            abstract=content[:1000] + "...", # Naive abstract: first 1000 chars
+            document_id=document_id,
+            owner_id=job.owner_id,
+            workspace_id=job.workspace_id
+        )
+        db.add(paper)
+        # Cached answers of the workspace were drawn from its previous set of papers
+        answer_cache.invalidate(db, job.workspace_id)
+        db.commit()
+
+        if chunks is None:
+            chunks, embeddings = [], []
+            if vector_index.get_index().copies_chunks:
+                rows = (
+                    db.query(models.PaperChunk.content, models.PaperChunk.embedding)
+                    .filter(models.PaperChunk.document_id == document_id)
+                    .order_by(models.PaperChunk.chunk_index)
+                    .all()
+                )
+                chunks = [row.content for row in rows]
+                embeddings = [list(row.embedding) for row in rows]
+        vector_store.index_paper(paper.workspace_id, paper.id, paper.title, paper.abstract, chunks, embeddings)
+        return paper.id
+    finally:
+        db.close()
+
+def fail_interrupted_jobs():
+    """
+    Job payloads live in memory, so jobs left unfinished by a previous process never
+    complete. Mark stale ones failed so clients stop polling.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=INGEST_STALE_SECONDS)
+    db = SessionLocal()
+    try:
+        db.query(models.IngestJob).filter(
+            models.IngestJob.status.in_(["queued", "downloading", "running"]),
+            models.IngestJob.updated_at < cutoff
+        ).update({"status": "failed", "error": "Interrupted by server restart"}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+async def shutdown():
+    global _client
+    for task in list(_tasks):
+        task.cancel()
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    pdf_service.shutdown()
@@ -0,0 +1,221 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Spans are recorded into process-wide histograms (exposed on /metrics) and, while a
+# request is being handled, into that request's Server-Timing breakdown. Recording is a
+# perf_counter pair, a bisect and a locked increment, cheap enough to leave on.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() == "true"
+
+# Seconds; spans range from sub-millisecond DB queries to multi-second LLM calls
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    """
+    Cumulative Prometheus histogram, one series per label tuple.
+    """
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...] = BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {} # labels -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], seconds: float):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2) + [0.0]
+            series[index] += 1 # index == len(buckets) is the +Inf bucket
+            series[-2] += 1
+            series[-1] += seconds
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            base = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            sep = "," if base else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_count{{{base}}} {series[-2]}")
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]}")
+        return lines
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+stage_duration = Histogram(
+    "researchhub_stage_duration_seconds",
+    "Time spent in an instrumented stage (embedding, search, LLM, database, ...).",
+    ("stage",)
+)
+request_duration = Histogram(
+    "researchhub_request_duration_seconds",
+    "HTTP request duration until the response body was sent.",
+    ("method", "route", "status")
+)
+
+# stage -> [total seconds, count] for the request being handled, None outside requests.
+# Threads started with asyncio.to_thread inherit it, so their spans are attributed too.
+_request_stages: contextvars.ContextVar[Optional[Dict[str, list]]] = contextvars.ContextVar("request_stages", default=None)
+
+def record(stage: str, seconds: float):
+    if not METRICS_ENABLED:
+        return
+    stage_duration.observe((stage,), seconds)
+    stages = _request_stages.get()
+    if stages is not None:
+        entry = stages.get(stage)
+        if entry is None:
+            stages[stage] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+def run_detached(fn, *args):
+    """
+    Calls fn with no request attached, e.g. run_detached(asyncio.create_task, coro):
+    tasks copy the current context, so background work started by a request would
+    otherwise keep adding to its Server-Timing breakdown after the response was sent.
+    """
+    context = contextvars.copy_context()
+    context.run(_request_stages.set, None)
+    return context.run(fn, *args)
+
+class span:
+    """
+    Times a block as `stage`: `with span("llm"):` or `async with span("llm"):`.
+    """
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, time.perf_counter() - self.start)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, *exc):
+        return self.__exit__(*exc)
+
+def timed(stage: str):
+    """
+    Decorator recording each call of a function or coroutine function as `stage`.
+    """
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def instrument_engine(engine, stage: str = "db"):
+    """
+    Records every statement executed through a SQLAlchemy engine (for async engines
+    pass engine.sync_engine).
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_query_start")
+        if starts:
+            record(stage, time.perf_counter() - starts.pop())
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("metrics_query_start"):
+            connection.info["metrics_query_start"].pop()
+
+def _server_timing(stages: Dict[str, list], total: float) -> str:
+    parts = [
+        f'{stage.replace(".", "-")};dur={seconds * 1000:.1f};desc="{count}x"'
+        for stage, (seconds, count) in stages.items()
+    ]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+def _route_label(scope) -> str:
+    # Templates rather than raw paths keep the label set small (/jobs/{job_id}, not /jobs/17)
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    endpoint = scope.get("endpoint")
+    return getattr(endpoint, "__name__", "unmatched")
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times requests and adds a Server-Timing header with the
+    stages recorded while producing the response headers. For streamed responses the
+    header covers the work done before the first byte (retrieval, prompt assembly).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        stages = {}
+        token = _request_stages.set(stages)
+        status = "500"
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                if SERVER_TIMING:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(stages, time.perf_counter() - start).encode()))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_stages.reset(token)
+            request_duration.observe((scope["method"], _route_label(scope), status), time.perf_counter() - start)
+
+def render() -> str:
+    """
+    All histograms in the Prometheus text exposition format.
+    """
+    lines = stage_duration.render() + request_duration.render()
+    return "\n".join(lines) + "\n"
@@ -1,26 +1,157 @@
-import io
+import logging
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from typing import Iterator, List, Optional
+
 import pdfplumber
 
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pages beyond this cap are ignored so a single huge document cannot monopolise the workers.
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", 500))
+# Seconds allowed for one page before it is skipped.
+PDF_PAGE_TIMEOUT = float(os.getenv("PDF_PAGE_TIMEOUT", 10))
+# Pages handed to a worker per task: larger ranges amortise re-opening the document.
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 8))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+class PageTimeout(Exception):
+    """Raised inside a worker when a single page exceeds PDF_PAGE_TIMEOUT."""
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API process runs threads (event loop, embedding batcher,
+        # to_thread workers) whose locks a forked child could inherit in a held state
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def _can_use_alarm() -> bool:
+    # SIGALRM is POSIX only and can only be installed from the main thread
+    return hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread()
+
+def _on_alarm(signum, frame):
+    raise PageTimeout()
+
+def _range_result(future, budget: float) -> List[str]:
+    """
+    Waits for a page range. Workers run tasks on their main thread, so with SIGALRM
+    they time out slow pages themselves and the range always completes.
+    """
+    if hasattr(signal, "SIGALRM"):
+        return future.result()
+    # Without it the parent gives up on the range instead. The clock starts once the
+    # pool dispatches the range, not while it is queued behind other documents; a
+    # dispatched range can still wait for one range per worker, hence twice the budget.
+    # A range given up on keeps its worker busy until it finishes.
+    while not future.running() and not future.done():
+        wait([future], timeout=0.1)
+    return future.result(timeout=2 * budget)
+
+def _count_pages(path: str) -> int:
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+def _extract_page_range(path: str, start: int, stop: int, page_timeout: float) -> List[str]:
+    """
+    Extracts pages [start, stop) of the document. Runs inside a worker process.
+    """
+    use_alarm = _can_use_alarm()
+    if use_alarm:
+        previous = signal.signal(signal.SIGALRM, _on_alarm)
+
+    texts = []
+    try:
+        with pdfplumber.open(path) as pdf:
+            for number in range(start, stop):
+                page = pdf.pages[number]
+                try:
+                    if use_alarm:
+                        signal.setitimer(signal.ITIMER_REAL, page_timeout)
+                    texts.append(page.extract_text() or "")
+                except PageTimeout:
+                    logger.warning("Page %s timed out after %ss, skipping", number + 1, page_timeout)
+                    texts.append("")
+                except Exception as e:
+                    logger.warning("Could not extract page %s: %s", number + 1, e)
+                    texts.append("")
+                finally:
+                    if use_alarm:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+                    # Release the parsed page objects, they are not needed again
+                    if hasattr(page, "close"):
+                        page.close()
+    finally:
+        if use_alarm:
+            signal.signal(signal.SIGALRM, previous)
+    return texts
+
+def iter_pages(file_content: bytes, max_pages: int = PDF_MAX_PAGES, page_timeout: float = PDF_PAGE_TIMEOUT) -> Iterator[str]:
+    """
+    Yields the text of each page in order while later pages are still being
+    extracted by the worker processes. Pages that fail or time out yield "".
+    """
+    # Workers read the document from disk rather than receiving a copy of the bytes per task
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(file_content)
+        path = f.name
+
+    pool = _get_pool()
+    futures = []
+    try:
+        try:
+            # Reading the page tree is cheap; doing it here avoids queueing behind other documents
+            with metrics.span("pdf.count_pages"):
+                page_count = _count_pages(path)
+        except Exception as e:
+            logger.warning("Could not open PDF: %s", e)
+            return
+
+        if page_count > max_pages:
+            logger.warning("PDF has %s pages, only the first %s are extracted", page_count, max_pages)
+            page_count = max_pages
+
+        for start in range(0, page_count, PDF_PAGES_PER_TASK):
+            stop = min(start + PDF_PAGES_PER_TASK, page_count)
+            futures.append((start, stop, pool.submit(_extract_page_range, path, start, stop, page_timeout)))
+
+        for start, stop, future in futures:
+            try:
+                with metrics.span("pdf.extract"):
+                    texts = _range_result(future, page_timeout * (stop - start) + page_timeout)
+            except FutureTimeoutError:
+                logger.warning("Pages %s-%s timed out, skipping", start + 1, stop)
+                texts = [""] * (stop - start)
+            except Exception as e:
+                logger.warning("Could not extract pages %s-%s: %s", start + 1, stop, e)
+                texts = [""] * (stop - start)
+            yield from texts
+    finally:
+        # Runs on normal completion and when the consumer stops iterating early
+        for _, _, future in futures:
+            future.cancel()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
 def extract_text_from_pdf(file_content: bytes) -> str:
     """
     Extracts text from a PDF file content (bytes) using pdfplumber.
     """
-    try:
-        with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-            text = ""
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-            
-            if not text.strip():
-                with open("pdf_errors.log", "a") as f:
-                    f.write("Warning: Extracted text is empty.\n")
-            
-            return text
-    except Exception as e:
-        error_msg = f"Error extracting text from PDF: {e}"
-        print(error_msg)
-        with open("pdf_errors.log", "a") as f:
-            f.write(error_msg + "\n")
-        return ""
+    text = "".join(page + "\n" for page in iter_pages(file_content) if page)
+    if not text.strip():
+        logger.warning("Extracted text is empty")
+    return text
+
+def shutdown():
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
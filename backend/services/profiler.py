@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Optional
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 10))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+# The loop is considered blocked when a 100ms heartbeat arrives this much too late
+LOOP_LAG_MONITOR = os.getenv("LOOP_LAG_MONITOR", "true").lower() == "true"
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", 250))
+LOOP_LAG_INTERVAL = 0.1
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is already being captured in this worker."""
+
+# Sampling every thread costs a little CPU, so only one capture runs at a time
+_capture_lock = threading.Lock()
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    # Function granularity (first line, not current line) so samples merge in the flamegraph
+    path = os.path.normpath(code.co_filename).split(os.sep)
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+def _stack(frame) -> list:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+class Sampler:
+    """
+    Wall-clock sampling profiler: a daemon thread snapshots every other thread's stack
+    with sys._current_frames() at a fixed interval. The result is in the collapsed
+    ("folded") format read by flamegraph.pl, speedscope and inferno:
+    "thread;outer;...;inner <samples>" per line.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> "Sampler":
+        if not _capture_lock.acquire(blocking=False):
+            raise ProfilerBusy()
+        self._thread.start()
+        return self
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        _capture_lock.release()
+        return self.folded()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                thread = names.get(thread_id, f"thread-{thread_id}")
+                self.counts[";".join([thread] + _stack(frame))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+async def capture(seconds: float, interval_ms: float = PROFILE_INTERVAL_MS) -> str:
+    """
+    Samples the whole worker for `seconds` (capped at PROFILE_MAX_SECONDS) without
+    blocking the event loop. Raises ProfilerBusy if a capture is already running.
+    """
+    sampler = Sampler(interval_ms).start()
+    try:
+        await asyncio.sleep(min(seconds, PROFILE_MAX_SECONDS))
+    finally:
+        folded = sampler.stop()
+    return folded
+
+class LoopLagMonitor:
+    """
+    Detects a blocked event loop. A coroutine beats every LOOP_LAG_INTERVAL; a watchdog
+    thread that sees no beat for LOOP_LAG_THRESHOLD_MS logs the loop thread's current
+    stack, i.e. the code holding the loop. Observed lag also goes to the
+    "event_loop.lag" histogram.
+    """
+
+    def __init__(self, threshold_ms: float = LOOP_LAG_THRESHOLD_MS):
+        self.threshold = threshold_ms / 1000
+        self._last_beat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-monitor", daemon=True)
+        self.stalls = 0
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._task = asyncio.create_task(self._beat())
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+        await asyncio.to_thread(self._watchdog.join)
+
+    async def _beat(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            now = time.monotonic()
+            metrics.record("event_loop.lag", max(now - before - LOOP_LAG_INTERVAL, 0.0))
+            self._last_beat = now
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(LOOP_LAG_INTERVAL):
+            last_beat = self._last_beat
+            blocked = time.monotonic() - last_beat - LOOP_LAG_INTERVAL
+            # Report each stall once, while it is happening, so the stack is the culprit's
+            if blocked < self.threshold or reported == last_beat:
+                continue
+            reported = last_beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "unavailable\n"
+            logger.warning("Event loop blocked for %.0f ms, loop thread stack:\n%s", blocked * 1000, stack)
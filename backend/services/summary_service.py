@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+from typing import Optional
+
+from services import groq_service
+
+# A small model is enough to fill in four short fields
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "llama-3.1-8b-instant")
+# Head of the paper (abstract, introduction, method) plus its tail (results, conclusion)
+SUMMARY_HEAD_CHARS = int(os.getenv("SUMMARY_HEAD_CHARS", 9000))
+SUMMARY_TAIL_CHARS = int(os.getenv("SUMMARY_TAIL_CHARS", 3000))
+
+SUMMARY_FIELDS = ("methodology", "findings", "limitations", "application_area")
+
+async def summarize_paper(title: str, text: str) -> Optional[dict]:
+    """
+    Generates a structured summary with the SUMMARY_FIELDS keys, or None if the
+    model call failed or did not return usable JSON.
+    """
+    if len(text) > SUMMARY_HEAD_CHARS + SUMMARY_TAIL_CHARS:
+        excerpt = text[:SUMMARY_HEAD_CHARS] + "\n[...]\n" + text[-SUMMARY_TAIL_CHARS:]
+    else:
+        excerpt = text
+
+    prompt = (
+        "Summarize the research paper below as a JSON object with exactly these string keys: "
+        "'methodology' (core method), 'findings' (key results), 'limitations' and 'application_area'. "
+        "Each value must be at most two sentences.\n\n"
+        f"Title: {title}\n\n{excerpt}"
+    )
+    try:
+        response = await groq_service.get_chat_response(
+            [{"role": "user", "content": prompt}],
+            model=SUMMARY_MODEL,
+            temperature=0,
+            response_format={"type": "json_object"}
+        )
+    except groq_service.LLMUnavailable:
+        return None
+    try:
+        data = json.loads(response)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    return {field: str(data.get(field) or "").strip() for field in SUMMARY_FIELDS}
+
+def content_hash(*parts: Optional[str]) -> str:
+    """
+    Stable hash of the text that goes into a prompt, so cached answers are tied to it.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
@@ -0,0 +1,380 @@
+import asyncio
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import List, Optional
+
+import numpy as np
+from sqlalchemy import select, func, literal_column, or_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Paper, PaperChunk
+from services.embedding_backends import EMBEDDING_DIMENSION
+
+# "pgvector" searches the paper_chunks table; "local" serves searches from per-workspace
+# memory-mapped matrices on disk and needs no database round trip.
+VECTOR_INDEX_BACKEND = os.getenv("VECTOR_INDEX_BACKEND", "pgvector")
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "vector_index"))
+# The HNSW scan yields at most ef_search candidates before the workspace filter, so a
+# small workspace in a shared table could get few or no hits. pgvector >= 0.8 keeps
+# scanning until enough rows pass the filter (iterative scan); older versions only get
+# the larger candidate list.
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 200))
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN", "relaxed_order") # relaxed_order, strict_order or off
+
+class VectorIndex:
+    """
+    Stores chunk embeddings per workspace (None is the global library) and returns
+    the nearest chunks as dicts sorted by descending cosine similarity:
+    {"paper_id", "chunk_index", "content", "title", "abstract", "score"}
+    """
+    name = "base"
+    # Whether add() keeps its own copy of the chunks, i.e. needs them for every new paper
+    copies_chunks = True
+
+    def add(self, workspace_id: Optional[int], paper_id: int, title: str, abstract: str, chunks: List[str], embeddings: List[list]):
+        raise NotImplementedError
+
+    async def search(self, db: Optional[AsyncSession], workspace_id: Optional[int], query_embedding: list, limit: int) -> List[dict]:
+        raise NotImplementedError
+
+    async def lexical_search(self, db: Optional[AsyncSession], workspace_id: Optional[int], query_text: str, limit: int) -> List[dict]:
+        """Full-text match over chunk content and paper titles; "score" is the text rank."""
+        raise NotImplementedError
+
+    def move_workspace(self, source_workspace_id: Optional[int], target_workspace_id: Optional[int]):
+        """Re-homes all chunks of a workspace, e.g. when its papers are unlinked."""
+        raise NotImplementedError
+
+class PgVectorIndex(VectorIndex):
+    """
+    The paper_chunks table with its HNSW index is the index: rows are written once per
+    document by the ingest job and reach a workspace through the papers referencing
+    the document, so add/move are no-ops.
+    """
+    name = "pgvector"
+    copies_chunks = False
+
+    def __init__(self):
+        self._iterative_scan: Optional[bool] = None
+
+    def add(self, workspace_id, paper_id, title, abstract, chunks, embeddings):
+        pass
+
+    async def _configure_scan(self, db: AsyncSession, limit: int):
+        if self._iterative_scan is None:
+            version = (await db.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'"))).scalar() or "0"
+            self._iterative_scan = tuple(int(part) for part in re.findall(r"\d+", version)[:2]) >= (0, 8)
+        # SET LOCAL: only for this transaction; values are not bindable, hence the int()
+        await db.execute(text(f"SET LOCAL hnsw.ef_search = {min(max(HNSW_EF_SEARCH, int(limit)), 1000)}"))
+        if self._iterative_scan and HNSW_ITERATIVE_SCAN in ("relaxed_order", "strict_order", "off"):
+            await db.execute(text(f"SET LOCAL hnsw.iterative_scan = {HNSW_ITERATIVE_SCAN}"))
+
+    async def search(self, db, workspace_id, query_embedding, limit):
+        await self._configure_scan(db, limit)
+        # pgvector's <=> operator returns cosine distance (1 - cosine_similarity),
+        # so sorting by distance ASC gives the most similar chunks first.
+        distance = PaperChunk.embedding.cosine_distance(query_embedding).label("distance")
+        stmt = (
+            select(
+                Paper.id.label("paper_id"),
+                PaperChunk.chunk_index,
+                PaperChunk.content,
+                Paper.title,
+                Paper.abstract,
+                distance,
+            )
+            .join(Paper, Paper.document_id == PaperChunk.document_id)
+        )
+
+        # Strict workspace isolation: no workspace means the global/default papers only
+        if workspace_id is not None:
+            stmt = stmt.filter(Paper.workspace_id == workspace_id)
+        else:
+            stmt = stmt.filter(Paper.workspace_id == None)
+
+        stmt = stmt.order_by(distance).limit(limit)
+        results = [
+            {
+                "paper_id": row.paper_id,
+                "chunk_index": row.chunk_index,
+                "content": row.content,
+                "title": row.title,
+                "abstract": row.abstract,
+                "score": 1 - row.distance,
+            }
+            for row in await db.execute(stmt)
+        ]
+        # relaxed_order may return rows slightly out of order
+        results.sort(key=lambda r: r["score"], reverse=True)
+        return results
+
+    async def lexical_search(self, db, workspace_id, query_text, limit):
+        # The expressions must match the GIN indexes in models.py, hence the literal config name
+        english = literal_column("'english'")
+        content_tsv = func.to_tsvector(english, PaperChunk.content)
+        title_tsv = func.to_tsvector(english, Paper.title)
+        query = func.websearch_to_tsquery(english, query_text)
+        rank = (func.ts_rank_cd(content_tsv, query) + func.ts_rank_cd(title_tsv, query)).label("rank")
+
+        stmt = (
+            select(
+                Paper.id.label("paper_id"),
+                PaperChunk.chunk_index,
+                PaperChunk.content,
+                Paper.title,
+                Paper.abstract,
+                rank,
+            )
+            .join(Paper, Paper.document_id == PaperChunk.document_id)
+            .filter(or_(content_tsv.op("@@")(query), title_tsv.op("@@")(query)))
+        )
+        if workspace_id is not None:
+            stmt = stmt.filter(Paper.workspace_id == workspace_id)
+        else:
+            stmt = stmt.filter(Paper.workspace_id == None)
+
+        stmt = stmt.order_by(rank.desc()).limit(limit)
+        return [
+            {
+                "paper_id": row.paper_id,
+                "chunk_index": row.chunk_index,
+                "content": row.content,
+                "title": row.title,
+                "abstract": row.abstract,
+                "score": float(row.rank),
+            }
+            for row in await db.execute(stmt)
+        ]
+
+    def move_workspace(self, source_workspace_id, target_workspace_id):
+        pass
+
+_TOKEN_RE = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were which with we our".split()
+)
+
+def _tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+class BM25Index:
+    """
+    Okapi BM25 over an append-only list of documents, updated incrementally.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list) # term -> [(doc, term frequency)]
+        self.doc_lengths = []
+        self.total_length = 0
+
+    def add(self, text: str):
+        doc = len(self.doc_lengths)
+        terms = Counter(_tokenize(text))
+        for term, tf in terms.items():
+            self.postings[term].append((doc, tf))
+        length = sum(terms.values())
+        self.doc_lengths.append(length)
+        self.total_length += length
+
+    def search(self, query_text: str, limit: int) -> List[tuple]:
+        """Returns [(doc, score)] best first."""
+        n = len(self.doc_lengths)
+        if not n:
+            return []
+        avg_length = self.total_length / n or 1
+        scores = defaultdict(float)
+        for term in set(_tokenize(query_text)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc] / avg_length)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+class _Shard:
+    """
+    One workspace on disk: <key>.f32 holds raw float32 rows, <key>.jsonl one metadata
+    line per row. Both files are append-only, vectors first.
+    """
+    row_bytes = EMBEDDING_DIMENSION * 4
+
+    def __init__(self, directory: str, key: str):
+        self.vectors_path = os.path.join(directory, f"{key}.f32")
+        self.meta_path = os.path.join(directory, f"{key}.jsonl")
+        self._reset()
+
+    def _reset(self):
+        self.matrix = np.zeros((0, EMBEDDING_DIMENSION), dtype=np.float32)
+        self.meta = []
+        self.loaded_size = 0
+        self.meta_offset = 0
+        self.lexical = BM25Index()
+
+    def _file_size(self) -> int:
+        try:
+            return os.path.getsize(self.vectors_path)
+        except OSError:
+            return 0
+
+    def load(self):
+        """
+        Picks up rows appended since the last load (possibly by another process):
+        only the new metadata lines are parsed and the matrix is re-mapped.
+        """
+        size = self._file_size()
+        if size == self.loaded_size:
+            return
+        if size < self.loaded_size:
+            self._reset() # Shard was deleted or rewritten
+        vector_rows = size // self.row_bytes
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                f.seek(self.meta_offset)
+                # Only consume complete lines, a concurrent writer may be mid-append. Lines
+                # without a vector row yet are left for a later load: after a crashed
+                # append the writer cuts them off before writing new rows (see _align).
+                while len(self.meta) < vector_rows:
+                    line = f.readline()
+                    if not line.endswith("\n"):
+                        break
+                    row = json.loads(line)
+                    self.meta.append(row)
+                    self.lexical.add(f"{row['title']} {row['content']}")
+                    self.meta_offset = f.tell()
+
+        rows = min(vector_rows, len(self.meta))
+        if rows:
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, EMBEDDING_DIMENSION))
+        self.loaded_size = rows * self.row_bytes
+
+    def _align(self):
+        """
+        A crash between (or during) the two appends leaves the files uneven. Cuts both
+        back to the rows they have in common, so row i of the matrix stays metadata
+        line i once more rows are appended.
+        """
+        vector_rows = self._file_size() // self.row_bytes
+        rows = 0
+        meta_end = 0
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "rb") as f:
+                for line in f:
+                    if rows == vector_rows or not line.endswith(b"\n"):
+                        break
+                    rows += 1
+                    meta_end += len(line)
+            if meta_end != os.path.getsize(self.meta_path):
+                os.truncate(self.meta_path, meta_end)
+        if self._file_size() != rows * self.row_bytes:
+            os.truncate(self.vectors_path, rows * self.row_bytes)
+
+    def append(self, vectors: np.ndarray, meta: List[dict]):
+        self._align()
+        with open(self.vectors_path, "ab") as f:
+            f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self.meta_path, "a", encoding="utf-8") as f:
+            for row in meta:
+                f.write(json.dumps(row) + "\n")
+
+    def delete(self):
+        for path in (self.vectors_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._reset()
+
+class LocalVectorIndex(VectorIndex):
+    """
+    Memory-mapped float32 matrix per workspace searched with one vectorized dot product
+    (exact search; vectors are L2-normalised so the dot product is the cosine). Shards
+    are read lazily and stay in the page cache, so searches are served from RAM. Writes
+    are appends, which suits single-writer deployments and local development.
+    """
+    name = "local"
+
+    def __init__(self, directory: str = VECTOR_INDEX_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._shards = {}
+        self._lock = threading.Lock()
+
+    def _shard(self, workspace_id: Optional[int]) -> _Shard:
+        key = "global" if workspace_id is None else f"workspace_{workspace_id}"
+        shard = self._shards.get(key)
+        if shard is None:
+            shard = self._shards[key] = _Shard(self.directory, key)
+        return shard
+
+    def add(self, workspace_id, paper_id, title, abstract, chunks, embeddings):
+        meta = [
+            {"paper_id": paper_id, "chunk_index": i, "content": chunk, "title": title, "abstract": abstract}
+            for i, chunk in enumerate(chunks)
+        ]
+        with self._lock:
+            self._shard(workspace_id).append(np.asarray(embeddings, dtype=np.float32), meta)
+
+    async def search(self, db, workspace_id, query_embedding, limit):
+        # Loading new rows and the matrix product are blocking work
+        return await asyncio.to_thread(self._search, workspace_id, query_embedding, limit)
+
+    def _search(self, workspace_id, query_embedding, limit):
+        with self._lock:
+            shard = self._shard(workspace_id)
+            shard.load()
+            matrix = shard.matrix
+            meta = shard.meta[:len(matrix)]
+        if not len(meta):
+            return []
+
+        query = np.array(query_embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = matrix @ query
+
+        # argpartition finds the top-k in linear time, then only those k get sorted
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [dict(meta[i], score=float(scores[i])) for i in top]
+
+    async def lexical_search(self, db, workspace_id, query_text, limit):
+        return await asyncio.to_thread(self._lexical_search, workspace_id, query_text, limit)
+
+    def _lexical_search(self, workspace_id, query_text, limit):
+        with self._lock:
+            shard = self._shard(workspace_id)
+            shard.load()
+            meta = shard.meta
+            hits = shard.lexical.search(query_text, limit)
+        return [dict(meta[doc], score=score) for doc, score in hits]
+
+    def move_workspace(self, source_workspace_id, target_workspace_id):
+        with self._lock:
+            source = self._shard(source_workspace_id)
+            source.load()
+            if len(source.matrix):
+                self._shard(target_workspace_id).append(np.array(source.matrix), source.meta[:len(source.matrix)])
+            source.delete()
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index() -> VectorIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if VECTOR_INDEX_BACKEND == "local":
+                    _index = LocalVectorIndex()
+                elif VECTOR_INDEX_BACKEND == "pgvector":
+                    _index = PgVectorIndex()
+                else:
+                    raise ValueError(f"Unknown vector index backend: {VECTOR_INDEX_BACKEND}")
+    return _index
@@ -1,52 +1,351 @@
-from sentence_transformers import SentenceTransformer
-from sqlalchemy.orm import Session
-from sqlalchemy import select
-from models import Paper
-import numpy as np
+from concurrent.futures import Future
+from typing import List
+from services.cache import TTLCache
+from services import embedding_backends, metrics, vector_index
+import database
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
 
-# Load model globally to avoid reloading on every request
 # 'all-mpnet-base-v2' is better performance, 'all-MiniLM-L6-v2' is faster.
 # Using MiniLM for detailed local development speed.
-model = SentenceTransformer('all-MiniLM-L6-v2') 
+MODEL_NAME = 'all-MiniLM-L6-v2'
+# "torch" (SentenceTransformer) or "onnx" (int8-quantized ONNX Runtime, CPU only)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# Cache keys include the backend: quantized vectors are close to, not equal to, the torch ones
+EMBEDDING_MODEL_KEY = f"{MODEL_NAME}:{EMBEDDING_BACKEND}"
+
+# The backend (and torch) is loaded on first use or by warmup() during app startup,
+# so importing this module stays cheap for scripts and auth-only code paths.
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend() -> embedding_backends.EmbeddingBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = embedding_backends.create_backend(EMBEDDING_BACKEND, MODEL_NAME)
+    return _backend
+
+def warmup():
+    """
+    Loads the model and runs one forward pass so the first request does not pay for it.
+    """
+    get_backend().encode(["warmup"])
+
+# Concurrent single-text requests are grouped into one forward pass.
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", 32))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", 5))
+
+class EmbeddingBatcher:
+    """
+    Collects texts submitted from any thread or coroutine and encodes them in
+    batches on a single background thread. Each caller gets its own Future.
+    A batch is flushed when it is full or when its oldest text has waited
+    max_wait_ms, so an idle service adds at most that much latency.
+    """
+
+    def __init__(self, encode, max_batch_size: int = EMBED_MAX_BATCH_SIZE, max_wait_ms: float = EMBED_MAX_WAIT_MS):
+        self._encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_batch_seen = 0
+        self._queue_wait_total = 0.0
+        self._encode_seconds = 0.0
+
+    def submit(self, text: str) -> Future:
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._process(batch)
+
+    def _process(self, batch):
+        # Drop requests whose caller already gave up (e.g. a cancelled coroutine)
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        try:
+            vectors = self._encode([text for text, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finished = time.perf_counter()
+
+        for (_, future, _), vector in zip(batch, vectors):
+            future.set_result(vector.tolist())
+
+        with self._stats_lock:
+            self._batches += 1
+            self._items += len(batch)
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+            self._queue_wait_total += sum(started - enqueued for _, _, enqueued in batch)
+            self._encode_seconds += finished - started
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "max_batch_size_seen": self._max_batch_seen,
+                "max_batch_size": self.max_batch_size,
+                "wait_window_ms": self.max_wait * 1000,
+                "avg_queue_wait_ms": self._queue_wait_total / self._items * 1000 if self._items else 0.0,
+                "encode_seconds": self._encode_seconds,
+                "items_per_second": self._items / self._encode_seconds if self._encode_seconds else 0.0,
+                "queued": self._queue.qsize(),
+            }
+
+_batcher = EmbeddingBatcher(lambda texts: get_backend().encode(texts, batch_size=len(texts)))
+
+# Query embeddings and search results are cached per worker process. Search results are
+# keyed by a workspace version that is bumped whenever the workspace's papers change;
+# the TTL bounds how long other workers can serve results from before such a change.
+_query_cache = TTLCache(
+    maxsize=int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 2048)),
+    ttl_seconds=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", 3600))
+)
+_search_cache = TTLCache(
+    maxsize=int(os.getenv("SEARCH_CACHE_SIZE", 1024)),
+    ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL", 60))
+)
+_workspace_versions = {}
+_versions_lock = threading.Lock()
+
+def _normalize_query(text: str) -> str:
+    # MiniLM's tokenizer is uncased and ignores repeated whitespace, so this keeps embeddings identical
+    return " ".join(text.lower().split())
+
+def get_workspace_version(workspace_id: int = None) -> int:
+    return _workspace_versions.get(workspace_id, 0)
+
+def bump_workspace_version(workspace_id: int = None):
+    """
+    Invalidates cached search results for a workspace (None is the global library).
+    Call after papers are inserted into, unlinked from or deleted from it.
+    """
+    with _versions_lock:
+        _workspace_versions[workspace_id] = _workspace_versions.get(workspace_id, 0) + 1
+
+def index_paper(workspace_id: int, paper_id: int, title: str, abstract: str, chunks: List[str], embeddings: List[list]):
+    """
+    Adds a stored paper's chunks to the vector index and invalidates cached searches.
+    """
+    vector_index.get_index().add(workspace_id, paper_id, title, abstract, chunks, embeddings)
+    bump_workspace_version(workspace_id)
+
+def unlink_workspace(workspace_id: int):
+    """
+    Moves a workspace's chunks to the global library after its papers were unlinked.
+    """
+    vector_index.get_index().move_workspace(workspace_id, None)
+    bump_workspace_version(workspace_id)
+    bump_workspace_version(None)
 
 def generate_embedding(text: str) -> list:
     """
     Generates a vector embedding for the given text.
+    Blocks the calling thread; coroutines should use generate_embedding_async.
     """
-    embedding = model.encode(text)
-    return embedding.tolist()
+    key = (EMBEDDING_MODEL_KEY, _normalize_query(text))
+    embedding = _query_cache.get(key)
+    if embedding is None:
+        embedding = _batcher.submit(text).result()
+        _query_cache.set(key, embedding)
+    return embedding
 
-def search_similar_papers(db: Session, query_text: str, workspace_id: int = None, limit: int = 5):
+async def generate_embedding_async(text: str) -> list:
     """
-    Searches for papers similar to the query text using cosine similarity.
-    Optionally filters by workspace_id.
+    Generates a vector embedding without blocking the event loop, sharing the
+    forward pass with any other concurrent requests.
+    """
+    key = (EMBEDDING_MODEL_KEY, _normalize_query(text))
+    embedding = _query_cache.get(key)
+    if embedding is None:
+        with metrics.span("embed.query"):
+            embedding = await asyncio.wrap_future(_batcher.submit(text))
+        _query_cache.set(key, embedding)
+    return embedding
+
+def get_embedding_stats() -> dict:
+    return _batcher.stats()
+
+def get_cache_stats() -> dict:
+    return {
+        "query_embeddings": _query_cache.stats(),
+        "search_results": _search_cache.stats(),
+    }
+
+@metrics.timed("embed.batch")
+def generate_embeddings(texts: List[str], batch_size: int = 32) -> List[list]:
+    """
+    Generates vector embeddings for several texts in a single batched forward pass.
+    """
+    if not texts:
+        return []
+    return get_backend().encode(texts, batch_size=batch_size).tolist()
+
+# Hybrid retrieval fuses vector and full-text results with reciprocal-rank fusion
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+RRF_K = int(os.getenv("RRF_K", 60))
+
+class LegStats:
     """
-    query_embedding = generate_embedding(query_text)
-    
-    # pgvector uses <-> for L2 distance, <=> for cosine distance, <#> for inner product
-    # We want cosine distance for semantic similarity.
-    # Note: pgvector's <=> operator returns distance (1 - cosine_similarity).
-    # So sorting by distance ASC gives most similar.
-    stmt = select(Paper).order_by(Paper.embedding.cosine_distance(query_embedding)).limit(limit)
-    
-    if workspace_id:
-        stmt = stmt.filter(Paper.workspace_id == workspace_id)
-    else:
-        # If no workspace specified, search only papers without workspace (global)?
-        # Or search all? Let's assume search all for now, or filter by None if strict.
-        # User requirement implies isolation. So if no workspace, maybe global.
-        # But for "My Papers", usually they belong to user. 
-        # Let's enforce strict isolation: if workspace_id=None, maybe strict filter.
-        # However, to start simply, let's just add the filter if provided.
-        # WAIT: cosine_distance sorting must happen AFTER filtering for efficiency? 
-        # Actually in SQL, WHERE comes before ORDER BY.
-        stmt = select(Paper)
-        if workspace_id is not None:
-             stmt = stmt.filter(Paper.workspace_id == workspace_id)
-        else:
-             stmt = stmt.filter(Paper.workspace_id == None) # Strict Global/Default isolation
-             
-        stmt = stmt.order_by(Paper.embedding.cosine_distance(query_embedding)).limit(limit)
-
-    results = db.execute(stmt).scalars().all()
+    Latency of one retrieval leg (vector or lexical).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.seconds_total = 0.0
+        self.seconds_max = 0.0
+
+    def record(self, seconds: float, failed: bool = False):
+        with self._lock:
+            self.calls += 1
+            self.errors += int(failed)
+            self.seconds_total += seconds
+            self.seconds_max = max(self.seconds_max, seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "avg_ms": self.seconds_total / self.calls * 1000 if self.calls else 0.0,
+                "max_ms": self.seconds_max * 1000,
+            }
+
+_leg_stats = {"vector": LegStats(), "lexical": LegStats()}
+
+def get_retrieval_stats() -> dict:
+    return {leg: stats.snapshot() for leg, stats in _leg_stats.items()}
+
+async def _run_leg(leg: str, search, *args):
+    # Each leg gets its own session so both can query the database concurrently.
+    # Callers must not hold a pooled connection meanwhile (see research._prepare_ask).
+    start = time.perf_counter()
+    failed = False
+    try:
+        async with database.AsyncSessionLocal() as session:
+            return await search(session, *args)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _leg_stats[leg].record(elapsed, failed)
+        metrics.record(f"search.{leg}", elapsed)
+
+def _reciprocal_rank_fusion(*rankings: List[dict]) -> List[dict]:
+    fused = {}
+    for hits in rankings:
+        for rank, hit in enumerate(hits):
+            key = (hit["paper_id"], hit["chunk_index"])
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = dict(hit, score=0.0)
+            entry["score"] += 1 / (RRF_K + rank + 1)
+    return sorted(fused.values(), key=lambda hit: hit["score"], reverse=True)
+
+async def _retrieve_chunks(query_text: str, workspace_id: int, query_embedding: list, fetch: int) -> List[dict]:
+    index = vector_index.get_index()
+    if not HYBRID_SEARCH:
+        return await _run_leg("vector", index.search, workspace_id, query_embedding, fetch)
+
+    vector_hits, lexical_hits = await asyncio.gather(
+        _run_leg("vector", index.search, workspace_id, query_embedding, fetch),
+        _run_leg("lexical", index.lexical_search, workspace_id, query_text, fetch),
+        return_exceptions=True
+    )
+    if isinstance(vector_hits, BaseException):
+        raise vector_hits
+    if isinstance(lexical_hits, BaseException):
+        # Full-text search is an enhancement; answer from vectors alone if it fails
+        logger.warning("Lexical search failed, using vector results only: %s", lexical_hits)
+        return vector_hits
+    return _reciprocal_rank_fusion(vector_hits, lexical_hits)
+
+async def search_similar_chunks(query_text: str, workspace_id: int = None, limit: int = 5, chunks_per_paper: int = 3, query_embedding: list = None):
+    """
+    Searches paper chunks relevant to the query and groups the hits per paper.
+    With HYBRID_SEARCH the vector and full-text legs run concurrently and are
+    fused by reciprocal rank; "score" is then the fused score. Returns at most
+    `limit` papers, best match first:
+    [{"paper_id", "title", "abstract", "score", "chunks": [{"chunk_index", "content", "score"}]}]
+    Pass query_embedding when it was already computed.
+    Results are cached and shared between callers, so treat them as read-only.
+    """
+    cache_key = (workspace_id, _normalize_query(query_text), limit, chunks_per_paper, get_workspace_version(workspace_id))
+    cached = _search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    if query_embedding is None:
+        query_embedding = await generate_embedding_async(query_text)
+
+    # Over-fetch chunks so that several papers survive the per-paper grouping
+    hits = await _retrieve_chunks(query_text, workspace_id, query_embedding, limit * chunks_per_paper * 2)
+
+    grouped = {}
+    for row in hits:
+        hit = grouped.get(row["paper_id"])
+        if hit is None:
+            if len(grouped) >= limit:
+                continue
+            hit = grouped[row["paper_id"]] = {
+                "paper_id": row["paper_id"],
+                "title": row["title"],
+                "abstract": row["abstract"],
+                "score": row["score"],
+                "chunks": [],
+            }
+        if len(hit["chunks"]) < chunks_per_paper:
+            hit["chunks"].append({"chunk_index": row["chunk_index"], "content": row["content"], "score": row["score"]})
+
+    # Hits arrive best-first, so insertion order is already best-first
+    results = list(grouped.values())
+    _search_cache.set(cache_key, results)
     return results
+
+async def search_similar_papers(query_text: str, workspace_id: int = None, limit: int = 5, query_embedding: list = None):
+    """
+    Searches for papers relevant to the query text.
+    Optionally filters by workspace_id.
+    """
+    return await search_similar_chunks(query_text, workspace_id=workspace_id, limit=limit, query_embedding=query_embedding)
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import sys
+import threading
+
+import bench_api
+
+# Checks the Groq client's limits, retries and coalescing against the fake Groq server
+# from bench_api.py. No API key or network access needed.
+#
+#   python verify_groq_client.py
+
+class ScriptedGroqHandler(bench_api.FakeGroqHandler):
+    """Fake Groq that can fail the next N calls and tracks how many run at once."""
+    lock = threading.Lock()
+    fail_next = 0
+    fail_status = 429
+    calls = 0
+    running = 0
+    max_running = 0
+
+    def do_POST(self):
+        cls = ScriptedGroqHandler
+        with cls.lock:
+            cls.calls += 1
+            cls.running += 1
+            cls.max_running = max(cls.max_running, cls.running)
+            fail = cls.fail_next > 0
+            if fail:
+                cls.fail_next -= 1
+        try:
+            if fail:
+                self.rfile.read(int(self.headers.get("content-length", 0)))
+                if cls.fail_status == 429:
+                    self._rate_limited()
+                else:
+                    self.send_response(cls.fail_status)
+                    self.send_header("content-length", "0")
+                    self.end_headers()
+                return
+            super().do_POST()
+        finally:
+            with cls.lock:
+                cls.running -= 1
+
+    @classmethod
+    def reset(cls, fail_next=0, fail_status=429):
+        cls.fail_next, cls.fail_status = fail_next, fail_status
+        cls.calls = cls.running = cls.max_running = 0
+
+def ask(text: str):
+    return [{"role": "user", "content": text}]
+
+async def check(name: str, coro):
+    try:
+        await coro
+        print(f"✅ {name}", flush=True)
+        return True
+    except Exception as e:
+        print(f"❌ {name}: {type(e).__name__}: {e}", flush=True)
+        return False
+
+async def main() -> int:
+    from services import groq_service
+
+    async def retries_rate_limits():
+        ScriptedGroqHandler.reset(fail_next=2)
+        response = await groq_service.get_chat_response(ask("retry"))
+        assert response, "empty response"
+        assert ScriptedGroqHandler.calls == 3, f"{ScriptedGroqHandler.calls} upstream calls, expected 3"
+
+    async def gives_up():
+        ScriptedGroqHandler.reset(fail_next=groq_service.GROQ_RETRIES + 1, fail_status=503)
+        try:
+            await groq_service.get_chat_response(ask("give up"))
+        except groq_service.LLMUnavailable:
+            return
+        raise AssertionError("no LLMUnavailable after exhausting retries")
+
+    async def coalesces_identical_prompts():
+        ScriptedGroqHandler.reset()
+        responses = await asyncio.gather(*(groq_service.get_chat_response(ask("same")) for _ in range(5)))
+        assert len(set(responses)) == 1, "callers got different answers"
+        assert ScriptedGroqHandler.calls == 1, f"{ScriptedGroqHandler.calls} upstream calls, expected 1"
+
+    async def limits_concurrency():
+        ScriptedGroqHandler.reset()
+        await asyncio.gather(*(groq_service.get_chat_response(ask(f"global {i}")) for i in range(12)))
+        assert ScriptedGroqHandler.max_running <= groq_service.GROQ_MAX_CONCURRENCY, \
+            f"{ScriptedGroqHandler.max_running} concurrent calls, limit {groq_service.GROQ_MAX_CONCURRENCY}"
+
+    async def limits_per_user():
+        ScriptedGroqHandler.reset()
+        await asyncio.gather(*(groq_service.get_chat_response(ask(f"user {i}"), user_id=1) for i in range(6)))
+        assert ScriptedGroqHandler.max_running <= groq_service.GROQ_PER_USER_CONCURRENCY, \
+            f"{ScriptedGroqHandler.max_running} concurrent calls for one user, limit {groq_service.GROQ_PER_USER_CONCURRENCY}"
+
+    async def streams_after_retry():
+        ScriptedGroqHandler.reset(fail_next=1)
+        parts = [delta async for delta in groq_service.stream_chat_response(ask("stream"), user_id=2)]
+        assert parts, "no deltas streamed"
+
+    results = [
+        await check("Retries rate-limited calls", retries_rate_limits()),
+        await check("Raises LLMUnavailable after the last retry", gives_up()),
+        await check("Coalesces identical concurrent prompts", coalesces_identical_prompts()),
+        await check("Caps concurrent calls per worker", limits_concurrency()),
+        await check("Caps concurrent calls per user", limits_per_user()),
+        await check("Retries opening a stream", streams_after_retry()),
+    ]
+    print(f"🔄 Client stats: {groq_service.get_stats()}", flush=True)
+    return 0 if all(results) else 1
+
+if __name__ == "__main__":
+    bench_api.FAKE_LLM_LATENCY = 0.1
+    server = bench_api.start_server(ScriptedGroqHandler)
+    # Read by the groq SDK and groq_service at import time
+    os.environ.update({
+        "GROQ_API_KEY": "verify",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{server.server_address[1]}",
+        "GROQ_MAX_CONCURRENCY": "4",
+        "GROQ_PER_USER_CONCURRENCY": "2",
+        "GROQ_RETRIES": "2",
+    })
+    try:
+        sys.exit(asyncio.run(main()))
+    finally:
+        server.shutdown()
@@ -51,7 +51,9 @@ const Dashboard = () => {
     const [workspaces, setWorkspaces] = useState<Workspace[]>([]);
     const [currentWorkspace, setCurrentWorkspace] = useState<Workspace | null>(null);
     const [allPapers, setAllPapers] = useState<Paper[]>([]);
+    const [nextPapersCursor, setNextPapersCursor] = useState<string | null>(null);
     const [messages, setMessages] = useState<Message[]>([]);
+    const [nextHistoryCursor, setNextHistoryCursor] = useState<string | null>(null);
     const [searchResults, setSearchResults] = useState<any[]>([]);
 
     // UI States
@@ -77,15 +79,36 @@ const Dashboard = () => {
 
     // --- API Interactions ---
 
-    const fetchPapers = async () => {
-        let url = 'http://localhost:8000/research/papers';
-        if (currentWorkspace) url += `?workspace_id=${currentWorkspace.id}`;
+    // The library is paginated; pass the cursor from the previous page to append the next one
+    const fetchPapers = async (cursor?: string) => {
+        const params = new URLSearchParams();
+        if (currentWorkspace) params.set('workspace_id', currentWorkspace.id.toString());
+        if (cursor) params.set('cursor', cursor);
         try {
-            const res = await fetch(url, { headers: { 'Authorization': `Bearer ${token}` } });
-            if (res.ok) setAllPapers(await res.json());
+            const res = await fetch(`http://localhost:8000/research/papers?${params}`, { headers: { 'Authorization': `Bearer ${token}` } });
+            if (res.ok) {
+                const page: Paper[] = await res.json();
+                setAllPapers(prev => cursor ? [...prev, ...page] : page);
+                setNextPapersCursor(res.headers.get('X-Next-Cursor'));
+            }
         } catch (err) { console.error("Failed to fetch papers"); }
     };
 
+    // Chat history comes newest page first; pass the cursor to prepend the next older page
+    const fetchHistory = async (cursor?: string) => {
+        const params = new URLSearchParams();
+        if (currentWorkspace) params.set('workspace_id', currentWorkspace.id.toString());
+        if (cursor) params.set('cursor', cursor);
+        try {
+            const res = await fetch(`http://localhost:8000/research/chat/history?${params}`, { headers: { 'Authorization': `Bearer ${token}` } });
+            if (res.ok) {
+                const page: Message[] = await res.json();
+                setMessages(prev => cursor ? [...page, ...prev] : page);
+                setNextHistoryCursor(res.headers.get('X-Next-Cursor'));
+            }
+        } catch (err) { console.error("Failed to fetch chat history"); }
+    };
+
     const fetchWorkspaces = async () => {
         try {
             const res = await fetch('http://localhost:8000/workspaces', { headers: { 'Authorization': `Bearer ${token}` } });
@@ -98,14 +121,6 @@ const Dashboard = () => {
     useEffect(() => { fetchWorkspaces(); }, [token]);
 
     useEffect(() => {
-        const fetchHistory = async () => {
-            let url = 'http://localhost:8000/research/chat/history';
-            if (currentWorkspace) url += `?workspace_id=${currentWorkspace.id}`;
-            try {
-                const res = await fetch(url, { headers: { 'Authorization': `Bearer ${token}` } });
-                if (res.ok) setMessages(await res.json());
-            } catch (err) { console.error("Failed to fetch chat history"); }
-        };
         if (currentWorkspace) {
             fetchHistory();
             fetchPapers();
@@ -132,6 +147,23 @@ const Dashboard = () => {
         } catch (err) { showNotification('Failed to create workspace', 'error'); }
     };
 
+    // Uploads and imports are processed in the background; poll until the job settles
+    const waitForJob = async (jobId: number): Promise<boolean> => {
+        for (let attempt = 0; attempt < 120; attempt++) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            try {
+                const res = await fetch(`http://localhost:8000/research/jobs/${jobId}`, {
+                    headers: { 'Authorization': `Bearer ${token}` }
+                });
+                if (!res.ok) return false;
+                const job = await res.json();
+                if (job.status === 'succeeded') return true;
+                if (job.status === 'failed') return false;
+            } catch (err) { return false; }
+        }
+        return false;
+    };
+
     const handleUpload = async (e: React.ChangeEvent<HTMLInputElement>) => {
         if (!e.target.files?.[0]) return;
         setUploading(true);
@@ -146,8 +178,11 @@ const Dashboard = () => {
                 body: formData
             });
             if (res.ok) {
-                showNotification('Paper uploaded successfully!', 'success');
-                fetchPapers();
+                const { job_id } = await res.json();
+                if (await waitForJob(job_id)) {
+                    showNotification('Paper uploaded successfully!', 'success');
+                    fetchPapers();
+                } else showNotification('Processing failed', 'error');
             } else showNotification('Upload failed', 'error');
         } catch (err) { showNotification('Error uploading paper', 'error'); }
         setUploading(false);
@@ -175,10 +210,13 @@ const Dashboard = () => {
                 })
             });
             if (res.ok) {
-                showNotification('Paper imported!', 'success');
-                fetchPapers();
                 setSearchResults([]); // Clear search after import
                 setSearchQuery('');
+                const { job_id } = await res.json();
+                if (await waitForJob(job_id)) {
+                    showNotification('Paper imported!', 'success');
+                    fetchPapers();
+                } else showNotification('Import failed', 'error');
             } else showNotification('Import failed', 'error');
         } catch (err) { showNotification('Error importing paper', 'error'); }
     };
@@ -191,7 +229,8 @@ const Dashboard = () => {
         setLoading(true);
 
         try {
-            const res = await fetch('http://localhost:8000/research/ask', {
+            // Stream the answer (server-sent events) so tokens show up as they are generated
+            const res = await fetch('http://localhost:8000/research/ask/stream', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${token}` },
                 body: JSON.stringify({
@@ -199,8 +238,32 @@ const Dashboard = () => {
                     workspace_id: currentWorkspace ? currentWorkspace.id : null
                 })
             });
-            const data = await res.json();
-            setMessages(prev => [...prev, { role: 'assistant', content: data.response }]);
+            if (!res.ok || !res.body) throw new Error('Request failed');
+
+            setMessages(prev => [...prev, { role: 'assistant', content: '' }]);
+            const appendToAnswer = (text: string) => setMessages(prev => {
+                const last = prev[prev.length - 1];
+                return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+            });
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop() || '';
+                for (const raw of events) {
+                    const event = raw.match(/^event: (.*)$/m)?.[1];
+                    const data = raw.match(/^data: (.*)$/m)?.[1];
+                    if (!data) continue;
+                    const payload = JSON.parse(data);
+                    if (event === 'error') appendToAnswer(payload.detail);
+                    else if (!event) appendToAnswer(payload.delta);
+                }
+            }
         } catch (err) {
             setMessages(prev => [...prev, { role: 'assistant', content: "Error communicating with AI." }]);
         }
@@ -463,7 +526,7 @@ const Dashboard = () => {
                     ) : (
                         // Paper Library Mode
                         <div className="space-y-1 p-2">
-                            {leftPanelOpen && <h3 className="text-xs font-bold text-gray-500 uppercase px-2 mb-2">Your Library ({allPapers.length})</h3>}
+                            {leftPanelOpen && <h3 className="text-xs font-bold text-gray-500 uppercase px-2 mb-2">Your Library ({allPapers.length}{nextPapersCursor ? '+' : ''})</h3>}
                             {allPapers.map(paper => (
                                 <div
                                     key={paper.id}
@@ -504,6 +567,14 @@ const Dashboard = () => {
                                     )}
                                 </div>
                             ))}
+                            {leftPanelOpen && nextPapersCursor && (
+                                <button
+                                    onClick={() => fetchPapers(nextPapersCursor)}
+                                    className="w-full py-1.5 text-xs font-bold text-purple-600 rounded hover:bg-purple-50 transition-colors"
+                                >
+                                    Load more
+                                </button>
+                            )}
                         </div>
                     )}
                 </div>
@@ -559,8 +630,18 @@ const Dashboard = () => {
                                         <h3 className="text-xl font-bold text-gray-600">Research Assistant</h3>
                                         <p className="text-gray-400 mt-2 max-w-md text-center">Select papers from the left to ask questions, or just start typing to search across your workspace.</p>
                                     </div>
-                                ) : (
-                                    messages.map((msg, idx) => (
+                                ) : (<>
+                                    {nextHistoryCursor && (
+                                        <div className="flex justify-center">
+                                            <button
+                                                onClick={() => fetchHistory(nextHistoryCursor)}
+                                                className="px-3 py-1.5 text-xs font-bold text-purple-600 rounded hover:bg-purple-50 transition-colors"
+                                            >
+                                                Load older messages
+                                            </button>
+                                        </div>
+                                    )}
+                                    {messages.map((msg, idx) => (
                                         <div key={idx} className={`flex ${msg.role === 'user' ? 'justify-end' : 'justify-start'}`}>
                                             <div className={`max-w-2xl p-5 rounded-2xl shadow-sm leading-relaxed ${msg.role === 'user'
                                                 ? 'bg-purple-600 text-white rounded-tr-none'
@@ -571,8 +652,8 @@ const Dashboard = () => {
                                                 </div>
                                             </div>
                                         </div>
-                                    ))
-                                )}
+                                    ))}
+                                </>)}
                                 {loading && (
                                     <div className="flex justify-start">
                                         <div className="bg-white p-4 rounded-2xl rounded-tl-none border border-gray-100 flex items-center gap-2 text-gray-500">